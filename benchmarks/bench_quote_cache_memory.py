@@ -0,0 +1,113 @@
+"""
+Memory benchmark: quote cache entries holding the decoded LI.FI response
+(the original {"data": ...} layout) vs the raw response text plus
+parse_quote() fields.
+
+Each layout is measured in a fresh interpreter so peak RSS reflects only
+the entries it builds.
+
+Run with: python benchmarks/bench_quote_cache_memory.py [count ...]
+"""
+import copy
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import orjson
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("LIFI_API_KEY", "bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+
+def sample_quote(i: int) -> dict:
+    """A LI.FI /v1/quote response of realistic shape and size (two steps)"""
+    token = {
+        "address": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48", "chainId": 1, "symbol": "USDC",
+        "decimals": 6, "name": "USD Coin", "coinKey": "USDC", "priceUSD": "0.9998",
+        "logoURI": "https://static.debank.com/image/coin/logo_url/usdc/e87790bfe0b3f2ea855dc29069b38818.png",
+    }
+    step = {
+        "id": f"step-{i}", "type": "cross", "tool": "across",
+        "toolDetails": {"key": "across", "name": "Across", "logoURI": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/bridges/acrossv2.png"},
+        "action": {
+            "fromChainId": 1, "toChainId": 137, "fromToken": token, "toToken": {**token, "chainId": 137},
+            "fromAmount": str(100_000_000 + i), "slippage": 0.005,
+            "fromAddress": "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045",
+            "toAddress": "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045",
+        },
+        "estimate": {
+            "tool": "across", "fromAmount": str(100_000_000 + i), "toAmount": "99652811", "toAmountMin": "99154547",
+            "approvalAddress": "0x1231DEB6f5749EF6cE6943a275A1D3E7486F4EaE", "executionDuration": 62,
+            "fromAmountUSD": "100.00", "toAmountUSD": "99.63",
+            "feeCosts": [{"name": "Relayer fee", "description": "Across relayer fee", "token": token,
+                          "amount": "347189", "amountUSD": "0.35", "percentage": "0.0035", "included": True}],
+            "gasCosts": [{"type": "SEND", "price": "23049712345", "estimate": "185000", "limit": "240500",
+                          "amount": "4264196783825000", "amountUSD": "10.71", "token": {**token, "symbol": "ETH"}}],
+        },
+    }
+    return {
+        "type": "lifi", "id": f"quote-{i}", "tool": "across",
+        "toolDetails": step["toolDetails"], "action": step["action"], "estimate": step["estimate"],
+        "includedSteps": [step, copy.deepcopy(step)],
+        "integrator": "chaincompass",
+        "transactionRequest": {
+            "data": "0x" + "ab" * 900, "to": "0x1231DEB6f5749EF6cE6943a275A1D3E7486F4EaE",
+            "value": "0x0", "from": "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045",
+            "chainId": 1, "gasPrice": "0x55dd3a8d9", "gasLimit": "0x3ab14",
+        },
+    }
+
+
+def build(layout: str, count: int) -> dict:
+    """Fill a dict with `count` cache entries in the given layout"""
+    from main import parse_quote
+
+    entries = {}
+    for i in range(count):
+        raw = orjson.dumps(sample_quote(i))
+        if layout == "decoded":
+            entries[i] = {"data": orjson.loads(raw), "fetched_at": time.time()}
+        else:
+            entries[i] = {"raw": raw.decode(), "summary": parse_quote(orjson.loads(raw)), "fetched_at": time.time()}
+    return entries
+
+
+def measure(layout: str, count: int) -> None:
+    """Child process: print peak RSS growth (KiB) while building the entries"""
+    from main import parse_quote  # noqa: F401 - import cost stays out of the delta
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    entries = build(layout, count)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(after - before, len(entries))
+
+
+def run(layout: str, count: int) -> float:
+    """Peak RSS growth in MiB for one layout, measured in a fresh interpreter"""
+    out = subprocess.run(
+        [sys.executable, __file__, "--measure", layout, str(count)],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return int(out[-2]) / 1024
+
+
+def main():
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[2], int(sys.argv[3]))
+        return
+
+    counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000]
+    raw_size = len(orjson.dumps(sample_quote(0)))
+    print(f"LI.FI quote: {raw_size / 1024:.1f} KiB as JSON\n")
+    print(f"{'quotes':>8}  {'decoded':>14}  {'raw + summary':>14}  {'saved':>7}")
+    for count in counts:
+        decoded = run("decoded", count)
+        compact = run("compact", count)
+        print(f"{count:>8,}  {decoded:>11.1f} MiB  {compact:>11.1f} MiB  {1 - compact / decoded:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
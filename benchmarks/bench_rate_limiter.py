@@ -0,0 +1,80 @@
+"""
+Microbenchmark: sliding window counter RateLimiter vs the previous
+list-of-timestamps implementation.
+
+Run with: python benchmarks/bench_rate_limiter.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from validation import RateLimiter
+
+
+class LegacyRateLimiter:
+    """The previous implementation: a list of datetimes per identifier"""
+    def __init__(self, max_requests: int = 100, window_seconds: int = 60):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.requests = defaultdict(list)
+
+    def is_allowed(self, identifier: str) -> bool:
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.window_seconds)
+        self.requests[identifier] = [
+            req_time for req_time in self.requests[identifier]
+            if req_time > cutoff
+        ]
+        if len(self.requests[identifier]) >= self.max_requests:
+            return False
+        self.requests[identifier].append(now)
+        return True
+
+
+def bench_hot_key(limiter_cls, max_requests: int, calls: int = 100_000) -> float:
+    """Average microseconds per check for one identifier at its limit"""
+    limiter = limiter_cls(max_requests=max_requests, window_seconds=60)
+    start = time.perf_counter()
+    for _ in range(calls):
+        limiter.is_allowed("0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045")
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def bench_many_keys(limiter, keys: int, requests_per_key: int = 1) -> tuple[float, float]:
+    """(microseconds per check, MiB retained) for `keys` distinct identifiers"""
+    identifiers = [f"0x{i:040x}" for i in range(keys)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(requests_per_key):
+        for identifier in identifiers:
+            limiter.is_allowed(identifier)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / (keys * requests_per_key) * 1e6, current / (1024 * 1024)
+
+
+if __name__ == "__main__":
+    print("Hot key (one identifier, window full)")
+    for max_requests in (50, 1000):
+        legacy = bench_hot_key(LegacyRateLimiter, max_requests, calls=20_000)
+        current = bench_hot_key(RateLimiter, max_requests)
+        print(f"  max_requests={max_requests:<5} legacy {legacy:8.2f} us/check   sliding window {current:6.2f} us/check")
+
+    scenarios = [
+        ("100k identifiers x 1 request", 100_000, 1, None),
+        ("10k identifiers x 50 requests", 10_000, 50, None),
+        ("100k identifiers, max_keys=10k", 100_000, 1, 10_000),
+    ]
+    for label, keys, per_key, max_keys in scenarios:
+        print(label)
+        legacy_us, legacy_mib = bench_many_keys(LegacyRateLimiter(max_requests=50, window_seconds=60), keys, per_key)
+        kwargs = {"max_keys": max_keys} if max_keys else {}
+        current_us, current_mib = bench_many_keys(RateLimiter(max_requests=50, window_seconds=60, **kwargs), keys, per_key)
+        print(f"  legacy          {legacy_us:6.2f} us/check   {legacy_mib:7.1f} MiB")
+        print(f"  sliding window  {current_us:6.2f} us/check   {current_mib:7.1f} MiB")
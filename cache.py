@@ -0,0 +1,469 @@
+"""
+Caching helpers for ChainCompass API
+"""
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import math
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional
+
+from cachetools import TTLCache
+
+
+class CacheBackend(ABC):
+    """
+    Interface for quote cache storage. Keys are tuples of strings, values
+    are JSON-serializable. Entries expire after `ttl` seconds and the store
+    never holds more than `maxsize` live entries.
+    """
+    name = "base"
+    maxsize: int
+    ttl: float
+
+    @abstractmethod
+    def get(self, key: tuple) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: tuple, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: tuple) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    # Used from the event loop; backends doing blocking I/O override these
+    # to run it in a thread
+    async def aget(self, key: tuple) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: tuple, value: Any) -> None:
+        self.set(key, value)
+
+    async def alen(self) -> int:
+        return len(self)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local TTL + LRU cache (one per uvicorn worker)"""
+    name = "memory"
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 60):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def get(self, key: tuple) -> Optional[Any]:
+        return self._cache.get(key)
+
+    def set(self, key: tuple, value: Any) -> None:
+        self._cache[key] = value
+
+    def delete(self, key: tuple) -> None:
+        self._cache.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache stored in a local SQLite file so every worker process on the host
+    shares the same entries. Expiry uses wall-clock time (shared across
+    processes); the oldest entries are evicted once maxsize is exceeded.
+    The async methods run queries in a thread, so waiting for another
+    worker's write lock never stalls the event loop.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = "./quote_cache.db", maxsize: int = 1000, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quote_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_quote_cache_expires ON quote_cache (expires_at)")
+
+    @staticmethod
+    def _encode_key(key: tuple) -> str:
+        return json.dumps(list(key))
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM quote_cache WHERE key = ?", (self._encode_key(key),)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: tuple, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quote_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (self._encode_key(key), json.dumps(value), now + self.ttl),
+            )
+            self._evict(now)
+
+    def delete(self, key: tuple) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM quote_cache WHERE key = ?", (self._encode_key(key),))
+
+    async def aget(self, key: tuple) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: tuple, value: Any) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    async def alen(self) -> int:
+        return await asyncio.to_thread(len, self)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM quote_cache WHERE expires_at <= ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM quote_cache").fetchone()
+        if count > self.maxsize:
+            self._conn.execute(
+                "DELETE FROM quote_cache WHERE key IN "
+                "(SELECT key FROM quote_cache ORDER BY expires_at LIMIT ?)",
+                (count - self.maxsize,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM quote_cache WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return count
+
+
+class TieredCache(CacheBackend):
+    """
+    Two-tier lookup: a small, short-lived in-process L1 in front of a shared
+    L2. L2 hits are copied into L1; writes go to both tiers. The L1 TTL
+    bounds how stale a worker's view of the shared cache can get.
+    """
+    def __init__(self, l1: CacheBackend, l2: CacheBackend):
+        self.l1 = l1
+        self.l2 = l2
+        self.name = f"{l1.name}+{l2.name}"
+        self.maxsize = l2.maxsize
+        self.ttl = l2.ttl
+        self.l1_hits = 0
+        self.l2_hits = 0
+
+    def get(self, key: tuple) -> Optional[Any]:
+        value = self.l1.get(key)
+        if value is not None:
+            self.l1_hits += 1
+            return value
+        value = self.l2.get(key)
+        if value is not None:
+            self.l2_hits += 1
+            self.l1.set(key, value)
+        return value
+
+    def set(self, key: tuple, value: Any) -> None:
+        self.l1.set(key, value)
+        self.l2.set(key, value)
+
+    def delete(self, key: tuple) -> None:
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def __len__(self) -> int:
+        return len(self.l2)
+
+    async def aget(self, key: tuple) -> Optional[Any]:
+        value = await self.l1.aget(key)
+        if value is not None:
+            self.l1_hits += 1
+            return value
+        value = await self.l2.aget(key)
+        if value is not None:
+            self.l2_hits += 1
+            await self.l1.aset(key, value)
+        return value
+
+    async def aset(self, key: tuple, value: Any) -> None:
+        await self.l1.aset(key, value)
+        await self.l2.aset(key, value)
+
+    async def alen(self) -> int:
+        return await self.l2.alen()
+
+
+def create_cache_backend(
+    backend: str = "memory",
+    maxsize: int = 1000,
+    ttl: float = 60,
+    path: str = "./quote_cache.db",
+    l1_maxsize: int = 256,
+    l1_ttl: float = 5,
+) -> CacheBackend:
+    """Build the quote cache for the configured backend ("memory" or "sqlite")"""
+    if backend == "memory":
+        return MemoryCacheBackend(maxsize=maxsize, ttl=ttl)
+    if backend == "sqlite":
+        return TieredCache(
+            MemoryCacheBackend(maxsize=l1_maxsize, ttl=min(l1_ttl, ttl)),
+            SQLiteCacheBackend(path=path, maxsize=maxsize, ttl=ttl),
+        )
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one in-flight task"""
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn() for key, or await the call already running for it.
+        Every caller gets the same result (or the same exception).
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # Shield so one cancelled caller doesn't cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+class HotKeyTracker:
+    """
+    Count cache hits per key so the hottest entries can be refreshed before
+    they expire. Keys idle for `window` seconds drop out of the ranking.
+    """
+    def __init__(self, maxsize: int = 512, window: float = 300):
+        self._hits: TTLCache = TTLCache(maxsize=maxsize, ttl=window)
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    def touch(self, key: Hashable, payload: Any = None) -> None:
+        """Record a hit; payload is whatever is needed to re-fetch the key"""
+        hits, _ = self._hits.get(key, (0, None))
+        self._hits[key] = (hits + 1, payload)
+
+    def top(self, n: int) -> list[tuple[Hashable, Any]]:
+        """Return up to n (key, payload) pairs, most-hit first"""
+        ranked = sorted(self._hits.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, payload) for key, (_, payload) in ranked[:n]]
+
+
+def bucket(value: Optional[float], size: float):
+    """Round value to the nearest multiple of size (no rounding when size <= 0)"""
+    if value is None:
+        return None
+    if size <= 0:
+        return value
+    return round(float(value) / size)
+
+
+class SummaryCache:
+    """
+    LRU/TTL cache for AI route summaries, keyed on parse_quote() fields.
+    Numbers are bucketed so near-identical quotes reuse the same sentence.
+    """
+    def __init__(
+        self,
+        maxsize: int = 2000,
+        ttl: int = 600,
+        fees_bucket: float = 0.05,
+        output_bucket: float = 0.5,
+        time_bucket: float = 5,
+    ):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flights = SingleFlight()
+        self.fees_bucket = fees_bucket
+        self.output_bucket = output_bucket
+        self.time_bucket = time_bucket
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def key(self, summary: dict) -> tuple:
+        return (
+            summary.get("provider"),
+            bucket(summary.get("fees_usd"), self.fees_bucket),
+            bucket(summary.get("output_usd"), self.output_bucket),
+            bucket(summary.get("time_seconds"), self.time_bucket),
+        )
+
+    def get(self, summary: dict) -> Optional[str]:
+        """Return the cached summary for this quote (counts a hit or miss)"""
+        cached = self._cache.get(self.key(summary))
+        if cached is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return cached
+
+    def set(self, summary: dict, text: str) -> None:
+        self._cache[self.key(summary)] = text
+
+    async def get_or_create(self, summary: dict, fn: Callable[[], Awaitable[str]]) -> str:
+        """Return the cached summary for this quote, or generate it once via fn()"""
+        cached = self.get(summary)
+        if cached is not None:
+            return cached
+
+        async def generate() -> str:
+            text = await fn()
+            self.set(summary, text)
+            return text
+
+        return await self._flights.do(self.key(summary), generate)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total) * 100 if total else 0.0
+        return {
+            "size": len(self._cache),
+            "max_size": self._cache.maxsize,
+            "ttl": f"{int(self._cache.ttl)}s",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{hit_rate:.1f}%",
+        }
+
+
+class QuoteKeyNormalizer:
+    """
+    Build quote cache keys that treat equivalent requests as the same quote:
+
+    - chains: ids, names and LI.FI keys ("1", "ethereum", "eth") map to the id
+    - tokens: symbols are upper-cased, addresses lower-cased; with a catalog,
+      known symbols map to their (lower-cased) address on the chain
+    - amounts (opt-in): bucketed by relative precision, e.g. 0.001 means
+      amounts within ~0.1% of each other share a cache entry
+    - fromAddress (opt-in): left out of the key when quotes for this
+      deployment don't depend on the sender
+
+    Also counts hits that only happened because of normalization, i.e. the
+    exact request key had not been seen within the cache TTL.
+
+    `catalog` is any object with chain_id(value) and token_address(chain_id,
+    value) lookups (see registry.CatalogRegistry); it takes precedence over
+    the static chain_aliases.
+    """
+    def __init__(
+        self,
+        chain_aliases: Optional[dict[str, str]] = None,
+        amount_precision: float = 0.0,
+        drop_address: bool = False,
+        maxsize: int = 1000,
+        ttl: float = 60,
+        catalog: Optional[Any] = None,
+    ):
+        self.chain_aliases = {alias.lower(): chain for alias, chain in (chain_aliases or {}).items()}
+        self.catalog = catalog
+        self.amount_precision = amount_precision
+        self.drop_address = drop_address
+        self._exact_seen: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.requests = 0
+        self.hits = 0
+        self.normalized_hits = 0
+
+    def chain(self, value: str) -> str:
+        value = value.strip()
+        if self.catalog is not None:
+            chain_id = self.catalog.chain_id(value)
+            if chain_id is not None:
+                return str(chain_id)
+        return self.chain_aliases.get(value.lower(), value)
+
+    def token(self, value: str, chain: Optional[str] = None) -> str:
+        """Canonical token; `chain` is an already canonical chain id"""
+        value = value.strip()
+        if self.catalog is not None and chain is not None and chain.isdigit():
+            address = self.catalog.token_address(int(chain), value)
+            if address is not None:
+                return address.lower()
+        return value.lower() if value.lower().startswith("0x") else value.upper()
+
+    def amount(self, value: str) -> str:
+        if self.amount_precision <= 0:
+            return value
+        try:
+            amount = int(value)
+        except ValueError:
+            return value
+        if amount <= 0:
+            return value
+        # Geometric buckets: every bucket spans the same relative width
+        return f"~{round(math.log(amount) / math.log1p(self.amount_precision))}"
+
+    def key(self, fromChain: str, toChain: str, fromToken: str, toToken: str,
+            fromAmount: str, fromAddress: Optional[str]) -> tuple:
+        from_chain, to_chain = self.chain(fromChain), self.chain(toChain)
+        key = (
+            from_chain,
+            to_chain,
+            self.token(fromToken, from_chain),
+            self.token(toToken, to_chain),
+            self.amount(fromAmount),
+        )
+        if self.drop_address:
+            return key
+        return key + ((fromAddress or "").lower(),)
+
+    def record(self, exact_key: Iterable, hit: bool) -> None:
+        """Track whether a cache hit would also have been a hit without normalization"""
+        exact_key = tuple(exact_key)
+        self.requests += 1
+        if hit:
+            self.hits += 1
+            if exact_key not in self._exact_seen:
+                self.normalized_hits += 1
+        self._exact_seen[exact_key] = True
+
+    def stats(self) -> dict:
+        gain = (self.normalized_hits / self.requests) * 100 if self.requests else 0.0
+        return {
+            "amount_precision": self.amount_precision,
+            "drop_address": self.drop_address,
+            "hits_from_normalization": self.normalized_hits,
+            "hit_rate_gain": f"{gain:.1f}%",
+        }
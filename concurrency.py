@@ -0,0 +1,84 @@
+"""
+Concurrency limits for outbound calls (LLM, upstream APIs)
+"""
+import asyncio
+import time
+from typing import Awaitable, Iterable
+
+
+class ConcurrencyLimiter:
+    """
+    Async semaphore that also tracks queue depth and how long callers waited.
+
+    Usage:
+        async with limiter:
+            await do_work()
+    """
+    def __init__(self, max_concurrency: int = 16):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def __aenter__(self):
+        start = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+    def stats(self) -> dict:
+        avg_wait = self.total_wait_seconds / self.acquired if self.acquired else 0.0
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "calls": self.acquired,
+            "avg_wait_ms": round(avg_wait * 1000, 2),
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+        }
+
+
+async def gather_with_deadline(aws: Iterable[Awaitable], timeout: float) -> list:
+    """
+    Run awaitables concurrently, waiting at most `timeout` seconds in total.
+    Results come back in input order; a failed awaitable yields its exception
+    and one still running at the deadline is cancelled and yields TimeoutError.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(asyncio.TimeoutError(f"Timed out after {timeout}s"))
+        elif task.exception() is not None:
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
@@ -0,0 +1,246 @@
+"""
+Transaction confirmation polling for ChainCompass API
+
+Pending transactions are checked against each chain's JSON-RPC endpoint
+(eth_getTransactionReceipt) and marked completed or failed once mined.
+"""
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import repositories
+
+
+def parse_rpc_urls(value: str) -> dict[int, str]:
+    """Parse "1=https://eth.example,137=https://polygon.example" into {chain_id: url}"""
+    urls = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        chain_id, url = item.split("=", 1)
+        urls[int(chain_id.strip())] = url.strip()
+    return urls
+
+
+class JsonRpcClient:
+    """
+    Minimal Ethereum JSON-RPC client. Receipts for many transactions on the
+    same chain are fetched with one batch request (up to max_batch calls).
+    """
+    def __init__(self, urls: dict[int, str], client: httpx.AsyncClient, max_batch: int = 100):
+        self.urls = urls
+        self.client = client
+        self.max_batch = max_batch
+        self.requests = 0
+
+    def supports(self, chain_id: Optional[int]) -> bool:
+        return chain_id in self.urls
+
+    async def get_receipts(self, chain_id: int, tx_hashes: list[str]) -> dict[str, Optional[dict]]:
+        """
+        Receipts by hash; None means the transaction isn't mined yet. Hashes the
+        node answered with an error are left out so they are retried later.
+        """
+        receipts = {}
+        for start in range(0, len(tx_hashes), self.max_batch):
+            chunk = tx_hashes[start:start + self.max_batch]
+            payload = [
+                {"jsonrpc": "2.0", "id": i, "method": "eth_getTransactionReceipt", "params": [tx_hash]}
+                for i, tx_hash in enumerate(chunk)
+            ]
+            self.requests += 1
+            resp = await self.client.post(self.urls[chain_id], json=payload)
+            resp.raise_for_status()
+            body = resp.json()
+            # Nodes that reject the whole batch answer with a single error object
+            if not isinstance(body, list):
+                raise ValueError(f"RPC error from chain {chain_id}: {body.get('error', body)}")
+            by_id = {item.get("id"): item for item in body}
+            for i, tx_hash in enumerate(chunk):
+                item = by_id.get(i)
+                if item is not None and "error" not in item:
+                    receipts[tx_hash] = item.get("result")
+        return receipts
+
+
+def receipt_update(tx_hash: str, receipt: dict) -> dict:
+    """Status update for a mined transaction; fees_paid is in the chain's native token"""
+    status = "completed" if int(receipt.get("status", "0x1"), 16) == 1 else "failed"
+    gas_used = int(receipt["gasUsed"], 16) if receipt.get("gasUsed") else None
+    gas_price = receipt.get("effectiveGasPrice")
+    return {
+        "tx_hash": tx_hash,
+        "status": status,
+        "confirmed_at": datetime.utcnow(),
+        "gas_used": float(gas_used) if gas_used is not None else None,
+        "fees_paid": gas_used * int(gas_price, 16) / 1e18 if gas_used is not None and gas_price else None,
+    }
+
+
+LEASE_NAME = "confirmation_poller"
+
+
+class ConfirmationPoller:
+    """
+    Background worker that resolves pending transactions.
+
+    Each pass checks up to batch_size pending rows (walking the backlog in id
+    order, wrapping at the end), with one batched RPC call per chain, and
+    applies the results in a single bulk update. The delay between passes
+    starts at min_interval, grows by `backoff` after every pass that resolves
+    nothing (up to max_interval), and drops back once something confirms or
+    wake() is called for a newly submitted transaction.
+
+    Every worker process starts a poller, but only the one holding the
+    "confirmation_poller" lease polls; the others check every max_interval
+    and take over once it expires (lease_ttl after the holder's last pass)
+    or is released on shutdown.
+    """
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int = 200,
+        min_interval: float = 5,
+        max_interval: float = 120,
+        backoff: float = 2.0,
+        lease_ttl: Optional[float] = None,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        # Must outlast the longest gap between the holder's passes
+        self.lease_ttl = lease_ttl if lease_ttl is not None else 2 * max_interval + 30
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leader = False
+        self.rpc: Optional[JsonRpcClient] = None
+        self._after_id = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.polls = 0
+        self.checked = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.rpc_errors = 0
+
+    # --- Lifecycle ---
+
+    def start(self, rpc: JsonRpcClient) -> None:
+        self.rpc = rpc
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.leader:
+            self.leader = False
+            try:
+                async with self.session_factory() as db:
+                    await repositories.release_lease(db, LEASE_NAME, self.owner)
+            except Exception as err:
+                print(f"⚠️ Could not release the confirmation poller lease: {err}")
+
+    def wake(self) -> None:
+        """Poll soon, e.g. after a transaction was submitted"""
+        self.interval = self.min_interval
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                resolved = await self.poll_once() if await self.acquire_lease() else None
+            except Exception as err:
+                resolved = 0
+                print(f"⚠️ Confirmation poll failed: {err}")
+            if resolved is None:
+                # Another worker polls; check back once its lease could have lapsed
+                self.interval = self.max_interval
+            else:
+                self.next_interval(resolved)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def next_interval(self, resolved: int) -> float:
+        if resolved:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+
+    # --- Polling ---
+
+    async def acquire_lease(self) -> bool:
+        """Take or renew the deployment-wide polling lease"""
+        async with self.session_factory() as db:
+            leader = await repositories.acquire_lease(db, LEASE_NAME, self.owner, self.lease_ttl)
+        if leader != self.leader:
+            print(f"🔁 Confirmation poller {'took' if leader else 'lost'} the polling lease ({self.owner})")
+        self.leader = leader
+        return leader
+
+    async def poll_once(self) -> int:
+        """Check one batch of pending transactions; returns how many were resolved"""
+        self.polls += 1
+        async with self.session_factory() as db:
+            pending = await repositories.list_pending_transactions(db, self.batch_size, self._after_id)
+        self._after_id = pending[-1].id if len(pending) == self.batch_size else 0
+
+        by_chain: dict[int, list[str]] = {}
+        for transaction in pending:
+            if transaction.tx_hash and self.rpc.supports(transaction.from_chain_id):
+                by_chain.setdefault(transaction.from_chain_id, []).append(transaction.tx_hash)
+        if not by_chain:
+            return 0
+
+        results = await asyncio.gather(
+            *(self.rpc.get_receipts(chain_id, hashes) for chain_id, hashes in by_chain.items()),
+            return_exceptions=True
+        )
+        updates = []
+        for chain_id, result in zip(by_chain, results):
+            if isinstance(result, Exception):
+                self.rpc_errors += 1
+                print(f"⚠️ Receipt lookup failed on chain {chain_id}: {result}")
+                continue
+            self.checked += len(result)
+            updates.extend(receipt_update(tx_hash, receipt) for tx_hash, receipt in result.items() if receipt is not None)
+
+        if updates:
+            async with self.session_factory() as db:
+                await repositories.bulk_update_transaction_status(db, updates)
+            self.confirmed += sum(1 for update in updates if update["status"] == "completed")
+            self.failed += sum(1 for update in updates if update["status"] == "failed")
+        return len(updates)
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.leader,
+            "chains": sorted(self.rpc.urls) if self.rpc is not None else [],
+            "polls": self.polls,
+            "receipts_checked": self.checked,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "rpc_errors": self.rpc_errors,
+            "rpc_requests": self.rpc.requests if self.rpc is not None else 0,
+            "interval": f"{self.interval:g}s",
+        }
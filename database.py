@@ -1,33 +1,157 @@
-from sqlalchemy import create_engine, Column, String, Float, Integer, DateTime, Boolean
+from sqlalchemy import create_engine, event, Column, String, Float, Integer, DateTime, Boolean, Index
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 import os
 
-DATABASE_URL = "sqlite:///./chaincompass.db"
+import metrics
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chaincompass.db")
+
+# Async drivers used for the request path (the sync engine is only used for
+# table creation at startup and by scripts)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+# Drivers that serve both engines (create_async_engine picks their async mode)
+DUAL_DRIVERS = {"postgresql+psycopg"}
+
+def to_async_url(url: str) -> str:
+    """Swap a database URL's blocking driver (e.g. sqlite+pysqlite) for its backend's asyncio one"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend in ASYNC_DRIVERS and parsed.drivername not in DUAL_DRIVERS and not parsed.get_dialect().is_async:
+        parsed = parsed.set(drivername=ASYNC_DRIVERS[backend])
+    return parsed.render_as_string(hide_password=False)
+
+def to_sync_url(url: str) -> str:
+    """Swap a database URL's driver for the default (blocking) one"""
+    parsed = make_url(url)
+    return parsed.set(drivername=parsed.get_backend_name()).render_as_string(hide_password=False)
+
+def pool_options(url: str) -> dict:
+    """Connection pool settings from the environment (not used for in-memory SQLite)"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_pre_ping": True,
+    }
+
+def connect_args(url: str) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        return {"check_same_thread": False}
+    return {}
+
+# SQLite performance profile, applied to every new connection. WAL lets
+# readers run alongside the writer; synchronous=NORMAL is durable across
+# app crashes in WAL mode and fsyncs only at checkpoints.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+engine = create_engine(to_sync_url(DATABASE_URL), connect_args=connect_args(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    to_async_url(DATABASE_URL),
+    connect_args=connect_args(DATABASE_URL),
+    **pool_options(DATABASE_URL),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+if make_url(DATABASE_URL).get_backend_name() == "sqlite":
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+# Statement timings for /metrics
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+
 Base = declarative_base()
 
 class TransactionHistory(Base):
     __tablename__ = "transactions"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_address = Column(String, index=True)
+    user_address = Column(String)
     from_chain_id = Column(Integer)
     to_chain_id = Column(Integer)
     from_token = Column(String)
     to_token = Column(String)
     from_amount = Column(String)
     to_amount = Column(String)
-    tx_hash = Column(String, index=True)
+    tx_hash = Column(String)
     status = Column(String, default="pending")  # pending, completed, failed
     gas_used = Column(Float, nullable=True)
     fees_paid = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     confirmed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # History is always "this wallet, newest first"; the index serves the
+        # filter, the sort and the keyset cursor without touching other rows
+        Index("ix_transactions_user_created", "user_address", "created_at", "id"),
+        # Status updates look transactions up by hash
+        Index("uq_transactions_tx_hash", "tx_hash", unique=True),
+        # The confirmation poller walks pending transactions in id order
+        Index("ix_transactions_status_id", "status", "id"),
+    )
     
+class TransactionStats(Base):
+    """
+    Running totals per (wallet, chain pair), maintained by the repository on
+    every transaction write. user_address ALL_WALLETS holds the global totals.
+    """
+    __tablename__ = "transaction_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_address = Column(String, nullable=False)
+    from_chain_id = Column(Integer)
+    to_chain_id = Column(Integer)
+    tx_count = Column(Integer, default=0)
+    pending_count = Column(Integer, default=0)
+    completed_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    volume = Column(Float, default=0.0)  # sum of from_amount
+    fees_total = Column(Float, default=0.0)
+    fees_count = Column(Integer, default=0)
+    confirmation_seconds_total = Column(Float, default=0.0)
+    confirmation_count = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("uq_transaction_stats_key", "user_address", "from_chain_id", "to_chain_id", unique=True),
+    )
+
+class WorkerLease(Base):
+    """
+    Named lease held by one worker process at a time, for background jobs
+    that should run once per deployment (e.g. the confirmation poller)
+    """
+    __tablename__ = "worker_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
 class UserSession(Base):
     __tablename__ = "sessions"
 
@@ -40,9 +164,28 @@ class UserSession(Base):
 
 Base.metadata.create_all(bind=engine)
 
+def ensure_indexes():
+    """
+    Add indexes introduced after a table was first created (create_all
+    skips existing tables). A unique index that can't be built because of
+    existing duplicates is reported and skipped.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as err:
+                print(f"⚠️ Could not create index {index.name}: {err}")
+
+ensure_indexes()
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,80 @@
+"""
+HTTP caching helpers for ChainCompass API: ETags, 304 Not Modified and
+precomputed (optionally pre-gzipped) response bodies for endpoints that are
+polled a lot.
+"""
+import hashlib
+from typing import Any, Callable, Hashable, Optional
+
+import orjson
+from fastapi import Request, Response
+
+
+def make_etag(data: bytes, weak: bool = False) -> str:
+    """Quoted ETag for some bytes; weak ETags mark semantically equal bodies"""
+    tag = f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+    return f"W/{tag}" if weak else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str, headers: Optional[dict] = None) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
+
+
+def accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+def precompressed_response(request: Request, body: bytes, gzipped: bytes, headers: Optional[dict] = None) -> Response:
+    """
+    JSON response from a body that was encoded and compressed ahead of time.
+    GZipMiddleware leaves responses that already have Content-Encoding alone.
+    """
+    headers = {"Vary": "Accept-Encoding", **(headers or {})}
+    if accepts_gzip(request):
+        return Response(content=gzipped, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def conditional_response(request: Request, body: bytes, etag: str, headers: Optional[dict] = None) -> Response:
+    """200 with the body, or 304 without it when the client already has this ETag"""
+    if etag_matches(request, etag):
+        return not_modified(etag, headers)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, **(headers or {})})
+
+
+class ResponseCache:
+    """
+    Serialized JSON bodies and their strong ETags, keyed by endpoint (and
+    parameters). A body is rebuilt only when the caller's version of the
+    underlying data changes, e.g. after a catalog refresh.
+    """
+    def __init__(self):
+        self._entries: dict[Hashable, tuple[Any, bytes, str]] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key: Hashable, version: Any, build: Callable[[], Any]) -> tuple[bytes, str]:
+        """(body, etag) for key, calling build() for fresh content if version changed"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1], entry[2]
+        body = orjson.dumps(build(), option=orjson.OPT_NON_STR_KEYS, default=str)
+        etag = make_etag(body)
+        self._entries[key] = (version, body, etag)
+        self.builds += 1
+        return body, etag
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "builds": self.builds}
@@ -1,33 +1,49 @@
 import os
-import json
+import gzip
 import asyncio
-from typing import Optional
+import time
+from datetime import datetime
+from typing import AsyncIterator, Optional
 import secrets
 import uuid
 
 import httpx
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Query, Depends, Cookie
+from fastapi import FastAPI, HTTPException, Query, Depends, Cookie, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from starlette.middleware.gzip import GZipMiddleware
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from dotenv import load_dotenv
-from pydantic import SecretStr, BaseModel, Field
+from pydantic import SecretStr, BaseModel, Field, field_validator
+import orjson
 from cachetools import TTLCache
-from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential, retry_if_exception_type
-from sqlalchemy.orm import Session
-from database import get_db, TransactionHistory, UserSession, engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+# --- 1. Load and Validate Environment Variables ---
+# This loads the .env file at the start of the application, before our own
+# modules are imported: database, validation and metrics read their settings
+# (DATABASE_URL, RATE_LIMIT_*, PROMETHEUS_MULTIPROC_DIR, ...) on import.
+load_dotenv()
+
+from database import get_async_db, engine, async_engine, AsyncSessionLocal
 from database import Base
+import repositories
+import metrics
 from validation import quote_limiter, tx_limiter, validate_ethereum_address, validate_chain_id, validate_amount
+from cache import CacheBackend, QuoteKeyNormalizer, SummaryCache, create_cache_backend
+from quotes import QuoteService, RETRY_ATTEMPTS, quote_data
+from concurrency import ConcurrencyLimiter, gather_with_deadline
+from confirmations import ConfirmationPoller, JsonRpcClient, parse_rpc_urls
+from ranking import WEIGHT_PROFILES, rank_routes, metric_matrix, score_routes
+from registry import CatalogRegistry
+from http_cache import ResponseCache, conditional_response, etag_matches, make_etag, not_modified, precompressed_response
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
-# --- 1. Load and Validate Environment Variables ---
-# This loads the .env file at the start of the application.
-load_dotenv()
-
 # We immediately get the API keys from the environment.
 LIFI_API_KEY = os.getenv("LIFI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -44,6 +60,7 @@ print("✅ API keys and environment variables loaded successfully.")
 
 # Shared HTTP client with connection pooling
 async_client: Optional[httpx.AsyncClient] = None
+LIFI_TIMEOUT = httpx.Timeout(15.0, read=15.0, connect=10.0)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -52,7 +69,7 @@ async def lifespan(app: FastAPI):
     global async_client
     async_client = httpx.AsyncClient(
         base_url="https://li.quest",
-        timeout=httpx.Timeout(15.0, read=15.0, connect=10.0),
+        timeout=LIFI_TIMEOUT,
         headers={
             "accept": "application/json",
             "x-lifi-api-key": LIFI_API_KEY,
@@ -60,11 +77,29 @@ async def lifespan(app: FastAPI):
         limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
         transport=httpx.AsyncHTTPTransport(retries=0)
     )
+    catalog.start(async_client)
+    quote_service.start(async_client)
+    async with AsyncSessionLocal() as db:
+        backfilled = await repositories.backfill_transaction_stats(db)
+    if backfilled:
+        print(f"📊 Built analytics aggregates from {backfilled} existing transactions")
+    if tx_writer is not None:
+        tx_writer.start()
+    if confirmation_poller is not None:
+        confirmation_poller.start(JsonRpcClient(RPC_URLS, httpx.AsyncClient(timeout=10.0)))
     yield
     # Shutdown event
+    quote_service.stop()
+    catalog.stop()
+    if confirmation_poller is not None:
+        await confirmation_poller.stop()
+        await confirmation_poller.rpc.client.aclose()
+    if tx_writer is not None:
+        await tx_writer.stop()
     if async_client is not None:
         await async_client.aclose()
         async_client = None
+    await async_engine.dispose()
 
 
 # --- 3. Initialize Application and AI Components ---
@@ -76,6 +111,7 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -99,6 +135,9 @@ app.add_middleware(
 # Enable gzip compression for faster responses
 app.add_middleware(GZipMiddleware, minimum_size=500)
 
+# Outermost, so request timings include compression
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Initialize the OpenAI model we want to use (gpt-4o-mini for speed and cost).
 # We wrap the API key in SecretStr to resolve the type warning.
 llm = ChatOpenAI(model="gpt-4o-mini", api_key=SecretStr(OPENAI_API_KEY))
@@ -116,6 +155,10 @@ prompt = ChatPromptTemplate.from_template(
 # When we call this chain, the data flows from the prompt to the model automatically.
 chain = prompt | llm
 
+# Cap concurrent LLM calls explicitly. Callers beyond the limit queue here
+# (visible in /api/v1/stats) instead of inside a thread pool.
+llm_limiter = ConcurrencyLimiter(max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")))
+
 
 # --- 3. Helper Functions ---
 
@@ -160,6 +203,83 @@ def parse_quote(quote_data):
     return summary
 
 
+def parse_routes(routes_data: dict) -> list[dict]:
+    """
+    Parse a LI.FI /v1/advanced/routes response into compact route dicts in
+    one pass: the parse_quote() fields (so routes can be ranked and
+    summarized like quotes) plus the route id, LI.FI tags and its steps.
+    """
+    routes = []
+    for route in routes_data.get("routes", []):
+        steps = route.get("steps", [])
+        fees_usd = sum(
+            float(fee.get("amountUSD") or 0)
+            for step in steps
+            for fee in step.get("estimate", {}).get("feeCosts", [])
+        )
+        gas_cost_usd = float(route.get("gasCostUSD") or 0)
+        input_usd = float(route.get("fromAmountUSD") or 0)
+        output_usd = float(route.get("toAmountUSD") or 0)
+        total_fees = fees_usd + gas_cost_usd
+        routes.append({
+            "id": route.get("id"),
+            "provider": " + ".join(step.get("toolDetails", {}).get("name", step.get("tool", "?")) for step in steps) or "N/A",
+            "time_seconds": sum(step.get("estimate", {}).get("executionDuration", 0) for step in steps),
+            "fees_usd": total_fees,
+            "output_usd": output_usd,
+            "input_usd": input_usd,
+            "price_impact": ((input_usd - output_usd - total_fees) / input_usd) * 100 if input_usd > 0 else 0.0,
+            "gas_cost_usd": gas_cost_usd,
+            "tags": route.get("tags", []),
+            "steps": [
+                {
+                    "tool": step.get("tool", "?"),
+                    "from_chain": str(step.get("action", {}).get("fromChainId", "?")),
+                    "to_chain": str(step.get("action", {}).get("toChainId", "?")),
+                    "from_token": step.get("action", {}).get("fromToken", {}).get("symbol", "?"),
+                    "to_token": step.get("action", {}).get("toToken", {}).get("symbol", "?"),
+                    "estimated_time": step.get("estimate", {}).get("executionDuration", 0),
+                }
+                for step in steps
+            ],
+        })
+    return routes
+
+
+async def summarize_quote(clean_summary: dict) -> str:
+    """
+    Get the AI summary for a parsed quote, reusing a cached sentence when
+    an equivalent quote was summarized recently.
+    """
+    async def generate() -> str:
+        async with llm_limiter:
+            with metrics.LLM_SECONDS.labels(metrics.endpoint(), metrics.chain_pair(), "invoke").time():
+                ai_response = await chain.ainvoke(clean_summary)
+        return ai_response.content
+
+    return await summary_cache.get_or_create(clean_summary, generate)
+
+
+async def stream_summary(clean_summary: dict) -> AsyncIterator[str]:
+    """
+    Stream the AI summary for a parsed quote chunk by chunk. A cached
+    summary is yielded in one piece; a fresh one is cached once complete.
+    """
+    cached = summary_cache.get(clean_summary)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async with llm_limiter:
+        with metrics.LLM_SECONDS.labels(metrics.endpoint(), metrics.chain_pair(), "stream").time():
+            async for chunk in chain.astream(clean_summary):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+    summary_cache.set(clean_summary, "".join(parts))
+
+
 # --- 4. API Endpoints ---
 
 @app.get("/")
@@ -167,78 +287,213 @@ def read_root():
     """A simple endpoint to confirm the server is running."""
     return {"message": "Welcome to the ChainCompass API!"}
 
+# Serialized bodies (with ETags) of the most-polled endpoints
+response_cache = ResponseCache()
+
 @app.get("/health")
-async def health() -> dict:
-    """Health check endpoint with system status"""
-    return {
-        "status": "ok",
-        "version": "2.0.0",
-        "services": {
-            "lifi": "connected",
-            "openai": "connected",
-            "cache": f"{len(quote_cache)}/{quote_cache.maxsize} entries"
+async def health(request: Request):
+    """Health check endpoint with system status (supports If-None-Match)"""
+    cache_size = await quote_cache.alen()
+
+    def build() -> dict:
+        return {
+            "status": "ok",
+            "version": "2.0.0",
+            "services": {
+                "lifi": "connected",
+                "openai": "connected",
+                "cache": f"{cache_size}/{quote_cache.maxsize} entries"
+            }
         }
-    }
+
+    body, etag = response_cache.get("health", cache_size, build)
+    return conditional_response(request, body, etag, {"Cache-Control": "no-cache"})
+
+SUPPORTED_CHAINS = [
+    {"id": 1, "name": "Ethereum", "symbol": "ETH", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/ethereum.svg"},
+    {"id": 137, "name": "Polygon", "symbol": "MATIC", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/polygon.svg"},
+    {"id": 42161, "name": "Arbitrum", "symbol": "ARB", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/arbitrum.svg"},
+    {"id": 10, "name": "Optimism", "symbol": "OP", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/optimism.svg"},
+    {"id": 8453, "name": "Base", "symbol": "BASE", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/base.svg"},
+]
+
+# LI.FI chain keys, accepted by /v1/quote in place of chain ids
+LIFI_CHAIN_KEYS = {1: "eth", 137: "pol", 42161: "arb", 10: "opt", 8453: "bas"}
+
+# Tokens listed when no chain is selected
+COMMON_TOKENS = [
+    {"symbol": "ETH", "name": "Ethereum", "decimals": 18},
+    {"symbol": "USDC", "name": "USD Coin", "decimals": 6},
+    {"symbol": "USDT", "name": "Tether", "decimals": 6},
+    {"symbol": "WBTC", "name": "Wrapped Bitcoin", "decimals": 8},
+    {"symbol": "DAI", "name": "Dai Stablecoin", "decimals": 18},
+]
+
+# Testnets accepted in transaction history (LI.FI's catalog lists mainnets)
+TESTNET_CHAIN_IDS = (11155111, 421614, 11155420, 84532)
+
+# Chain/token catalog loaded from LI.FI. A snapshot on disk keeps cold starts
+# working offline; until one exists, SUPPORTED_CHAINS is the fallback.
+catalog = CatalogRegistry(
+    snapshot_path=os.getenv("CATALOG_SNAPSHOT_PATH", "./catalog_snapshot.json"),
+    refresh_interval=float(os.getenv("CATALOG_REFRESH_INTERVAL", "21600")),
+    fallback_chains=[
+        {"id": chain["id"], "key": LIFI_CHAIN_KEYS[chain["id"]], "name": chain["name"],
+         "coin": chain["symbol"], "logoURI": chain["logo"]}
+        for chain in SUPPORTED_CHAINS
+    ],
+    extra_chain_ids=TESTNET_CHAIN_IDS,
+)
+
+# Catalog responses only change on a catalog refresh
+CATALOG_CACHE_CONTROL = "public, max-age=300"
 
 @app.get("/api/v1/chains")
-async def get_supported_chains():
+async def get_supported_chains(request: Request):
     """Get list of supported blockchain networks"""
-    chains = [
-        {"id": 1, "name": "Ethereum", "symbol": "ETH", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/ethereum.svg"},
-        {"id": 137, "name": "Polygon", "symbol": "MATIC", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/polygon.svg"},
-        {"id": 42161, "name": "Arbitrum", "symbol": "ARB", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/arbitrum.svg"},
-        {"id": 10, "name": "Optimism", "symbol": "OP", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/optimism.svg"},
-        {"id": 8453, "name": "Base", "symbol": "BASE", "logo": "https://raw.githubusercontent.com/lifinance/types/main/src/assets/icons/chains/base.svg"},
-    ]
-    return {"chains": chains, "count": len(chains)}
+    def build() -> dict:
+        chains = [
+            {
+                "id": chain["id"],
+                "key": chain.get("key"),
+                "name": chain.get("name"),
+                "symbol": chain.get("coin"),
+                "logo": chain.get("logoURI")
+            }
+            for chain in catalog.chains.values()
+        ]
+        return {"chains": chains, "count": len(chains)}
+
+    body, etag = response_cache.get("chains", catalog.version, build)
+    return conditional_response(request, body, etag, {"Cache-Control": CATALOG_CACHE_CONTROL})
 
 @app.get("/api/v1/tokens")
-async def get_supported_tokens():
-    """Get list of commonly supported tokens"""
-    tokens = [
-        {"symbol": "ETH", "name": "Ethereum", "decimals": 18},
-        {"symbol": "USDC", "name": "USD Coin", "decimals": 6},
-        {"symbol": "USDT", "name": "Tether", "decimals": 6},
-        {"symbol": "WBTC", "name": "Wrapped Bitcoin", "decimals": 8},
-        {"symbol": "DAI", "name": "Dai Stablecoin", "decimals": 18},
-    ]
-    return {"tokens": tokens, "count": len(tokens)}
+async def get_supported_tokens(
+    request: Request,
+    chain_id: Optional[int] = Query(None, description="List every token on this chain")
+):
+    """
+    Get list of commonly supported tokens with their address on each chain,
+    or every token LI.FI supports on one chain.
+    """
+    if chain_id is not None and catalog.chain(chain_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown chain")
+
+    def build() -> dict:
+        if chain_id is not None:
+            tokens = [
+                {
+                    "symbol": token.get("symbol"),
+                    "name": token.get("name"),
+                    "decimals": token.get("decimals"),
+                    "address": token.get("address"),
+                    "logo": token.get("logoURI")
+                }
+                for token in catalog.chain_tokens(chain_id)
+            ]
+            return {"chain_id": chain_id, "tokens": tokens, "count": len(tokens)}
+
+        tokens = [
+            dict(token, addresses={
+                chain: address
+                for chain in catalog.chains
+                if (address := catalog.token_address(chain, token["symbol"])) is not None
+            })
+            for token in COMMON_TOKENS
+        ]
+        return {"tokens": tokens, "count": len(tokens)}
+
+    body, etag = response_cache.get(("tokens", chain_id), catalog.version, build)
+    return conditional_response(request, body, etag, {"Cache-Control": CATALOG_CACHE_CONTROL})
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms labeled by
+    endpoint and chain pair, summed over all workers in multiprocess mode.
+    """
+    # Multiprocess mode reads every worker's files, so keep it off the event loop
+    body = await asyncio.to_thread(metrics.render)
+    return Response(content=body, media_type=metrics.CONTENT_TYPE_LATEST)
 
 @app.get("/api/v1/stats")
 async def get_api_stats():
     """Get API usage statistics"""
-    global request_count, cache_hits, cache_misses
-    
-    hit_rate = 0.0
-    if request_count > 0:
-        hit_rate = (cache_hits / request_count) * 100
-    
+    cache_size = await quote_cache.alen()
     return {
         "cache": {
-            "size": len(quote_cache),
+            "backend": quote_cache.name,
+            "size": cache_size,
             "max_size": quote_cache.maxsize,
-            "utilization": f"{(len(quote_cache) / quote_cache.maxsize) * 100:.1f}%"
-        },
-        "requests": {
-            "total": request_count,
-            "cache_hits": cache_hits,
-            "cache_misses": cache_misses,
-            "hit_rate": f"{hit_rate:.1f}%"
+            "utilization": f"{(cache_size / quote_cache.maxsize) * 100:.1f}%"
         },
+        **quote_service.stats(),
+        "summaries": summary_cache.stats(),
+        "llm": llm_limiter.stats(),
+        "catalog": catalog.stats(),
+        "responses": {**response_cache.stats(), "detailed_bodies": len(detailed_bodies)},
+        "db_writes": tx_writer.stats() if tx_writer is not None else None,
+        "confirmations": confirmation_poller.stats() if confirmation_poller is not None else None,
         "performance": {
-            "cache_ttl": "60s",
-            "max_retries": 3,
-            "timeout": "15s"
+            "cache_ttl": f"{quote_cache.ttl:g}s",
+            "max_retries": RETRY_ATTEMPTS,
+            "timeout": f"{LIFI_TIMEOUT.read:g}s"
         }
     }
 
-# In-memory TTL cache for quotes
-quote_cache: TTLCache = TTLCache(maxsize=1000, ttl=60)
+# Stale-while-revalidate: entries older than QUOTE_SOFT_TTL are served marked
+# stale and refreshed in the background; QUOTE_CACHE_TTL is the hard expiry.
+QUOTE_SOFT_TTL = float(os.getenv("QUOTE_SOFT_TTL", "30"))
+
+# Hot-key refresh: every QUOTE_REFRESH_INTERVAL seconds the QUOTE_REFRESH_TOP_N
+# most-requested quotes are refreshed before they go stale (0 disables).
+QUOTE_REFRESH_INTERVAL = float(os.getenv("QUOTE_REFRESH_INTERVAL", "5"))
+QUOTE_REFRESH_TOP_N = int(os.getenv("QUOTE_REFRESH_TOP_N", "20"))
 
-# Request tracking
-request_count = 0
-cache_hits = 0
-cache_misses = 0
+# Quote cache. "memory" keeps a TTLCache per worker; "sqlite" shares entries
+# between all workers on the host through a small in-process L1 in front.
+quote_cache: CacheBackend = create_cache_backend(
+    backend=os.getenv("QUOTE_CACHE_BACKEND", "memory"),
+    maxsize=int(os.getenv("QUOTE_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("QUOTE_CACHE_TTL", "60")),
+    path=os.getenv("QUOTE_CACHE_PATH", "./quote_cache.db"),
+    l1_ttl=float(os.getenv("QUOTE_CACHE_L1_TTL", "5")),
+)
+
+# Cache key normalization. Chain/token identifiers are always canonicalized
+# through the catalog;
+# amount bucketing and dropping fromAddress are opt-in because the cached
+# quote (and its transactionRequest) is then shared between requests.
+quote_keys = QuoteKeyNormalizer(
+    catalog=catalog,
+    amount_precision=float(os.getenv("QUOTE_KEY_AMOUNT_PRECISION", "0")),
+    drop_address=os.getenv("QUOTE_KEY_DROP_ADDRESS", "false").lower() == "true",
+    maxsize=quote_cache.maxsize,
+    ttl=quote_cache.ttl,
+)
+
+# One quote service for every endpoint: shared cache, retries, coalescing,
+# stale-while-revalidate and counters
+quote_service = QuoteService(
+    cache=quote_cache,
+    keys=quote_keys,
+    limiter=quote_limiter,
+    soft_ttl=QUOTE_SOFT_TTL,
+    refresh_interval=QUOTE_REFRESH_INTERVAL,
+    refresh_top_n=QUOTE_REFRESH_TOP_N,
+    hot_window=float(os.getenv("QUOTE_HOT_WINDOW", "120")),
+    extractors={"quote": parse_quote, "routes": parse_routes},
+)
+
+# AI summary cache in front of the prompt | llm chain. Buckets control how
+# close two quotes must be (in USD / seconds) to share the same sentence.
+summary_cache = SummaryCache(
+    maxsize=int(os.getenv("SUMMARY_CACHE_SIZE", "2000")),
+    ttl=int(os.getenv("SUMMARY_CACHE_TTL", "600")),
+    fees_bucket=float(os.getenv("SUMMARY_BUCKET_FEES_USD", "0.05")),
+    output_bucket=float(os.getenv("SUMMARY_BUCKET_OUTPUT_USD", "0.5")),
+    time_bucket=float(os.getenv("SUMMARY_BUCKET_TIME_SECONDS", "5")),
+)
 
 # Request/Response models
 class QuoteRequest(BaseModel):
@@ -253,6 +508,7 @@ class QuoteRequest(BaseModel):
 
 class QuoteSummary(BaseModel):
     summary: str
+    stale: bool = False  # True when served from cache past the soft TTL
     provider: Optional[str] = None
     time_seconds: Optional[int] = None
     fees_usd: Optional[float] = None
@@ -299,6 +555,19 @@ class TransactionStatus(BaseModel):
     status: str
     user_address: str
 
+class TransactionStatusUpdate(BaseModel):
+    tx_hash: str
+    status: str = Field(..., pattern="^(pending|completed|failed)$")
+    confirmed_at: Optional[datetime] = None
+    gas_used: Optional[float] = None
+    fees_paid: Optional[float] = None
+
+    @field_validator("confirmed_at")
+    @classmethod
+    def confirmed_at_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """Stored next to naive UTC created_at values, so convert offsets to UTC"""
+        return repositories.utc_naive(value)
+
 class RouteStep(BaseModel):
     tool: str
     from_chain: str
@@ -322,33 +591,60 @@ class DetailedQuote(BaseModel):
     from_token_info: TokenInfo
     to_token_info: TokenInfo
 
+async def fetch_quote_summary(req: QuoteRequest) -> dict:
+    """parse_quote() fields of the LI.FI quote for a request, via the shared quote service"""
+    return (await quote_service.get(req))["summary"]
+
+def quote_summary_from(clean_summary: dict, ai_summary: str = "", stale: bool = False) -> QuoteSummary:
+    """Build a QuoteSummary from parse_quote() output"""
+    return QuoteSummary(
+        summary=ai_summary,
+        stale=stale,
+        provider=clean_summary.get("provider"),
+        time_seconds=clean_summary.get("time_seconds"),
+        fees_usd=clean_summary.get("fees_usd"),
+        output_usd=clean_summary.get("output_usd"),
+        price_impact=clean_summary.get("price_impact"),
+        gas_cost_usd=clean_summary.get("gas_cost_usd"),
+    )
+
+def quote_cache_headers(entry: dict) -> dict:
+    """
+    Freshness headers for a response built from a quote cache entry: fresh
+    for QUOTE_SOFT_TTL after LI.FI answered, then usable while revalidating
+    until the cache's hard TTL. Age is how long ago LI.FI answered.
+    """
+    swr = max(0, int(quote_cache.ttl - QUOTE_SOFT_TTL))
+    return {
+        "Cache-Control": f"private, max-age={int(QUOTE_SOFT_TTL)}, stale-while-revalidate={swr}",
+        "Age": str(max(0, int(time.time() - entry["fetched_at"]))),
+    }
+
+def quote_etag(view: str, req: QuoteRequest, entry: dict) -> str:
+    """
+    Weak ETag for a view of a cached quote. It only changes when the cache
+    entry does, so a revalidation is answered without re-summarizing.
+    """
+    return make_etag(repr((view, quote_service.cache_key(req), entry["fetched_at"], entry["stale"])).encode(), weak=True)
+
 @app.get("/api/v1/quote", response_model=QuoteSummary)
 async def get_lifi_quote(
+    request: Request,
     fromChain: str = Query(..., min_length=1, max_length=10),
     toChain: str = Query(..., min_length=1, max_length=10),
     fromToken: str = Query(..., min_length=2, max_length=12),
     toToken: str = Query(..., min_length=2, max_length=12),
     fromAmount: str = Query(..., pattern=r"^\d{1,30}$"),
-    fromAddress: Optional[str] = Query("0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045")
+    fromAddress: Optional[str] = Query("0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"),
+    stream: bool = Query(False, description="Stream the response as Server-Sent Events")
 ):
     """
     Fetch LI.FI quote (pooled async client + TTL cache + retries) and summarize via LLM.
-    """
-    global async_client
-    if async_client is None:
-        raise HTTPException(status_code=503, detail="HTTP client not ready")
-
-    # Rate limiting
-    if not quote_limiter.is_allowed(fromAddress):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Max 50 requests/minute")
-    
-    # Validate inputs
-    if not validate_ethereum_address(fromAddress):
-        raise HTTPException(status_code=400, detail="Invalid Ethereum address")
-    
-    if not validate_amount(fromAmount):
-        raise HTTPException(status_code=400, detail="Invalid amount. Must be between 0.001 and 1,000,000")
 
+    With stream=true the response is Server-Sent Events: a `quote` event with
+    the numbers as soon as LI.FI answers, `token` events as the AI summary is
+    generated, then `done` with the full summary (or `error`).
+    """
     req = QuoteRequest(
         fromChain=fromChain,
         toChain=toChain,
@@ -358,137 +654,314 @@ async def get_lifi_quote(
         fromAddress=fromAddress,
     )
 
-    global request_count, cache_hits, cache_misses
-    request_count += 1
-    
-    cache_key = (req.fromChain, req.toChain, req.fromToken, req.toToken, req.fromAmount, req.fromAddress)
+    entry = await quote_service.get(req)
+    clean_summary = entry["summary"]
 
-    if cache_key in quote_cache:
-        cache_hits += 1
-        raw_quote_data = quote_cache[cache_key]
-    else:
-        cache_misses += 1
-        async def fetch() -> dict:
-            resp = await async_client.get("/v1/quote", params=req.model_dump())
-            resp.raise_for_status()
-            return resp.json()
+    if stream:
+        return StreamingResponse(
+            stream_quote_events(clean_summary, stale=entry["stale"]),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
 
-        try:
-            async for attempt in AsyncRetrying(
-                reraise=True,
-                stop=stop_after_attempt(3),
-                wait=wait_exponential(multiplier=0.5, min=0.5, max=4),
-                retry=retry_if_exception_type((httpx.ConnectError, httpx.ReadTimeout, httpx.RemoteProtocolError))
-            ):
-                with attempt:
-                    raw_quote_data = await fetch()
-            quote_cache[cache_key] = raw_quote_data
-        except httpx.HTTPStatusError as err:
-            detail = err.response.text if err.response is not None else str(err)
-            status = err.response.status_code if err.response is not None else 502
-            raise HTTPException(status_code=status, detail=f"LI.FI error: {detail}")
-        except (httpx.ConnectError, httpx.ReadTimeout, httpx.RemoteProtocolError) as err:
-            raise HTTPException(status_code=504, detail=f"Upstream timeout: {str(err)}")
-        except Exception as err:
-            raise HTTPException(status_code=502, detail=f"Upstream failure: {str(err)}")
-
-    clean_summary = parse_quote(raw_quote_data)
-    # Offload blocking LLM call to thread executor to avoid blocking event loop
-    ai_response = await asyncio.get_event_loop().run_in_executor(None, chain.invoke, clean_summary)
-    ai_summary = ai_response.content
+    headers = quote_cache_headers(entry)
+    etag = quote_etag("summary", req, entry)
+    if etag_matches(request, etag):
+        return not_modified(etag, headers)
 
-    return QuoteSummary(
-        summary=ai_summary,
-        provider=clean_summary.get("provider"),
-        time_seconds=clean_summary.get("time_seconds"),
-        fees_usd=clean_summary.get("fees_usd"),
-        output_usd=clean_summary.get("output_usd"),
-        price_impact=clean_summary.get("price_impact"),
-        gas_cost_usd=clean_summary.get("gas_cost_usd"),
-    )
+    ai_summary = await summarize_quote(clean_summary)
+
+    quote = quote_summary_from(clean_summary, ai_summary, stale=entry["stale"])
+    return ORJSONResponse(quote.model_dump(), headers={"ETag": etag, **headers})
+
+async def stream_quote_events(clean_summary: dict, stale: bool = False) -> AsyncIterator[str]:
+    """SSE events for a streamed quote: numbers first, then summary tokens"""
+    yield sse_event("quote", quote_summary_from(clean_summary, stale=stale).model_dump(exclude={"summary"}))
+    parts = []
+    try:
+        async for token in stream_summary(clean_summary):
+            parts.append(token)
+            yield sse_event("token", {"content": token})
+    except Exception as err:
+        yield sse_event("error", {"error": f"Summary failed: {str(err)}"})
+        return
+    yield sse_event("done", {"summary": "".join(parts)})
+
+# Route comparison limits. Routes are fetched concurrently, so the batch
+# size is bounded by the shared deadline rather than by serial latency.
+COMPARE_MAX_ROUTES = int(os.getenv("COMPARE_MAX_ROUTES", "20"))
+COMPARE_DEADLINE_SECONDS = float(os.getenv("COMPARE_DEADLINE_SECONDS", "12"))
+
+# Query parameter accepting any ranking profile name
+PROFILE_PATTERN = f"^({'|'.join(WEIGHT_PROFILES)})$"
 
 @app.post("/api/v1/compare")
-async def compare_routes(routes: list[QuoteRequest]):
+async def compare_routes(
+    routes: list[QuoteRequest],
+    profile: str = Query("balanced", pattern=PROFILE_PATTERN),
+    pareto_only: bool = Query(False, description="Drop routes dominated on output, fees and time")
+):
     """
-    Compare multiple swap routes and return the best option
+    Compare multiple swap routes and return the best option.
+    All routes are fetched concurrently; any route still running when the
+    shared deadline passes is returned as a timed-out partial result.
+    Successful routes are ranked together using the chosen weight profile.
     """
-    if len(routes) > 5:
-        raise HTTPException(status_code=400, detail="Maximum 5 routes can be compared at once")
-    
-    results = []
-    for route in routes:
-        try:
-            # Get quote for each route
-            quote = await get_lifi_quote(
-                fromChain=route.fromChain,
-                toChain=route.toChain,
-                fromToken=route.fromToken,
-                toToken=route.toToken,
-                fromAmount=route.fromAmount,
-                fromAddress=route.fromAddress
-            )
-            results.append({
+    if len(routes) > COMPARE_MAX_ROUTES:
+        raise HTTPException(status_code=400, detail=f"Maximum {COMPARE_MAX_ROUTES} routes can be compared at once")
+
+    async def quote_route(route: QuoteRequest) -> QuoteSummary:
+        entry = await quote_service.get(route)
+        clean_summary = entry["summary"]
+        ai_summary = await summarize_quote(clean_summary)
+        return quote_summary_from(clean_summary, ai_summary, stale=entry["stale"])
+
+    quotes = await gather_with_deadline(
+        [quote_route(route) for route in routes], timeout=COMPARE_DEADLINE_SECONDS
+    )
+
+    results, failures = [], []
+    for route, quote in zip(routes, quotes):
+        if isinstance(quote, asyncio.TimeoutError):
+            failures.append({
                 "route": route.model_dump(),
-                "quote": quote.model_dump(),
-                "score": calculate_route_score(quote)
+                "error": str(quote),
+                "timed_out": True,
+                "score": 0
             })
-        except Exception as e:
-            results.append({
+        elif isinstance(quote, Exception):
+            failures.append({
                 "route": route.model_dump(),
-                "error": str(e),
+                "error": str(quote),
                 "score": 0
             })
-    
-    # Sort by score (higher is better)
-    results.sort(key=lambda x: x.get("score", 0), reverse=True)
-    
+        else:
+            results.append({
+                "route": route.model_dump(),
+                "quote": quote
+            })
+
+    # Rank all successful routes in one pass (best first), failures last
+    ranked = rank_routes([r["quote"] for r in results], profile=profile, pareto_only=pareto_only)
+    results = [
+        dict(results[i], quote=results[i]["quote"].model_dump(), score=score, pareto_optimal=on_front)
+        for i, score, on_front in ranked
+    ] + failures
+
     return {
         "routes": results,
         "best_route": results[0] if results else None,
-        "comparison_count": len(results)
+        "profile": profile,
+        "comparison_count": len(routes),
+        "timed_out_count": sum(1 for r in failures if r.get("timed_out"))
     }
 
-def calculate_route_score(quote: QuoteSummary) -> float:
+def calculate_route_score(quote: QuoteSummary, profile: str = "balanced") -> float:
     """
-    Calculate a score for a route based on multiple factors
-    Higher score = better route
+    Calculate a score for a single route (higher = better route).
+    Use ranking.rank_routes to score many routes at once.
     """
-    score = 0.0
-    
-    # Output amount (higher is better)
-    if quote.output_usd:
-        score += quote.output_usd * 10
-    
-    # Fees (lower is better)
-    if quote.fees_usd:
-        score -= quote.fees_usd * 20
-    
-    # Time (faster is better)
-    if quote.time_seconds:
-        score -= quote.time_seconds * 0.1
-    
-    # Price impact (lower is better)
-    if quote.price_impact:
-        score -= abs(quote.price_impact) * 5
-    
-    return max(score, 0)
+    return float(score_routes(metric_matrix([quote]), profile)[0])
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
+
+@app.post("/api/v1/compare/stream")
+async def compare_routes_stream(
+    routes: list[QuoteRequest],
+    profile: str = Query("balanced", pattern=PROFILE_PATTERN)
+):
+    """
+    Streaming variant of /api/v1/compare (Server-Sent Events).
+
+    Events:
+    - quote:   numbers and score for one route, as soon as LI.FI answers
+    - error:   a route that failed or missed the shared deadline
+    - summary: the AI summary for a route, once the LLM finishes
+    - done:    the best route and totals, always the last event
+    """
+    if len(routes) > COMPARE_MAX_ROUTES:
+        raise HTTPException(status_code=400, detail=f"Maximum {COMPARE_MAX_ROUTES} routes can be compared at once")
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + COMPARE_DEADLINE_SECONDS
+        fetches = {asyncio.ensure_future(fetch_quote_summary(route)): i for i, route in enumerate(routes)}
+        summaries: dict[asyncio.Future, int] = {}
+        scored: list[dict] = []
+        timed_out = 0
+        pending = set(fetches)
+
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task in fetches:
+                        index = fetches[task]
+                        route = routes[index].model_dump()
+                        if task.exception() is not None:
+                            yield sse_event("error", {"index": index, "route": route, "error": str(task.exception())})
+                            continue
+                        clean_summary = task.result()
+                        quote = quote_summary_from(clean_summary)
+                        result = {
+                            "index": index,
+                            "route": route,
+                            "quote": quote.model_dump(exclude={"summary"}),
+                            "score": calculate_route_score(quote, profile)
+                        }
+                        scored.append(result)
+                        yield sse_event("quote", result)
+                        summary_task = asyncio.ensure_future(summarize_quote(clean_summary))
+                        summaries[summary_task] = index
+                        pending.add(summary_task)
+                    else:
+                        index = summaries[task]
+                        if task.exception() is not None:
+                            yield sse_event("summary", {"index": index, "summary": None, "error": str(task.exception())})
+                        else:
+                            yield sse_event("summary", {"index": index, "summary": task.result()})
+
+            for task in pending:
+                if task in fetches:
+                    timed_out += 1
+                    index = fetches[task]
+                    yield sse_event("error", {
+                        "index": index,
+                        "route": routes[index].model_dump(),
+                        "error": f"Timed out after {COMPARE_DEADLINE_SECONDS}s",
+                        "timed_out": True
+                    })
+                else:
+                    yield sse_event("summary", {
+                        "index": summaries[task],
+                        "summary": None,
+                        "error": f"Timed out after {COMPARE_DEADLINE_SECONDS}s",
+                        "timed_out": True
+                    })
+        finally:
+            for task in list(fetches) + list(summaries):
+                if not task.done():
+                    task.cancel()
+
+        best = max(scored, key=lambda r: r["score"]) if scored else None
+        yield sse_event("done", {
+            "best_route": best,
+            "comparison_count": len(routes),
+            "timed_out_count": timed_out
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/v1/routes")
+async def get_alternative_routes(
+    fromChain: str = Query(..., min_length=1, max_length=10),
+    toChain: str = Query(..., min_length=1, max_length=10),
+    fromToken: str = Query(..., min_length=2, max_length=12),
+    toToken: str = Query(..., min_length=2, max_length=12),
+    fromAmount: str = Query(..., pattern=r"^\d{1,30}$"),
+    fromAddress: Optional[str] = Query("0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"),
+    profile: str = Query("balanced", pattern=PROFILE_PATTERN),
+    pareto_only: bool = Query(False, description="Drop routes dominated on output, fees and time"),
+    top_k: int = Query(3, ge=0, le=10, description="How many of the best routes get an AI summary")
+):
+    """
+    All alternative routes LI.FI knows for a swap, ranked with our own
+    scoring. Only the top_k routes are summarized by the LLM; the rest
+    come back with summary set to null.
+    """
+    req = QuoteRequest(
+        fromChain=fromChain,
+        toChain=toChain,
+        fromToken=fromToken,
+        toToken=toToken,
+        fromAmount=fromAmount,
+        fromAddress=fromAddress
+    )
+    entry = await quote_service.get_routes(req)
+    routes = entry["summary"]
+    ranked = rank_routes(routes, profile=profile, pareto_only=pareto_only)
+
+    results = [
+        dict(routes[i], score=score, pareto_optimal=on_front, summary=None)
+        for i, score, on_front in ranked
+    ]
+    summaries = await gather_with_deadline(
+        [summarize_quote(route) for route in results[:top_k]], timeout=COMPARE_DEADLINE_SECONDS
+    )
+    for route, summary in zip(results, summaries):
+        if not isinstance(summary, Exception):
+            route["summary"] = summary
+
+    return {
+        "routes": results,
+        "best_route": results[0] if results else None,
+        "profile": profile,
+        "route_count": len(routes),
+        "stale": entry["stale"]
+    }
+
+class RouteCandidate(BaseModel):
+    id: Optional[str] = None  # caller's label, echoed back
+    output_usd: Optional[float] = None
+    fees_usd: Optional[float] = None
+    time_seconds: Optional[float] = None
+    price_impact: Optional[float] = None
+
+# Upper bound on candidates per ranking request
+RANK_MAX_CANDIDATES = 1000
+
+@app.post("/api/v1/rank")
+async def rank_candidates(
+    candidates: list[RouteCandidate],
+    profile: str = Query("balanced", pattern=PROFILE_PATTERN),
+    pareto_only: bool = Query(False, description="Drop routes dominated on output, fees and time")
+):
+    """
+    Rank alternative routes the client already has (e.g. from a route
+    search), without fetching quotes. Returns candidates best first.
+    """
+    if len(candidates) > RANK_MAX_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"Maximum {RANK_MAX_CANDIDATES} candidates per request")
+
+    ranked = rank_routes(candidates, profile=profile, pareto_only=pareto_only)
+    return {
+        "profile": profile,
+        "candidate_count": len(candidates),
+        "routes": [
+            {"index": i, **candidates[i].model_dump(), "score": score, "pareto_optimal": on_front}
+            for i, score, on_front in ranked
+        ]
+    }
+
+# Encoded and gzipped detailed views, keyed by ETag (i.e. by quote cache entry)
+detailed_bodies: TTLCache = TTLCache(
+    maxsize=int(os.getenv("DETAILED_BODY_CACHE_SIZE", "200")), ttl=quote_cache.ttl
+)
 
 @app.get("/api/v1/quote/detailed")
 async def get_detailed_quote(
-    fromChain: str = Query(...),
-    toChain: str = Query(...),
-    fromToken: str = Query(...),
-    toToken: str = Query(...),
-    fromAmount: str = Query(...),
+    request: Request,
+    fromChain: str = Query(..., min_length=1, max_length=10),
+    toChain: str = Query(..., min_length=1, max_length=10),
+    fromToken: str = Query(..., min_length=2, max_length=12),
+    toToken: str = Query(..., min_length=2, max_length=12),
+    fromAmount: str = Query(..., pattern=r"^\d{1,30}$"),
     fromAddress: Optional[str] = Query("0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045")
 ):
     """
-    Get detailed quote with full route information
+    Get detailed quote with full route information.
+    Shares the quote cache with /api/v1/quote, so the detailed view of a
+    quote that was just summarized costs nothing upstream.
     """
-    global async_client
-    if async_client is None:
-        raise HTTPException(status_code=503, detail="HTTP client not ready")
-
     req = QuoteRequest(
         fromChain=fromChain,
         toChain=toChain,
@@ -498,37 +971,38 @@ async def get_detailed_quote(
         fromAddress=fromAddress,
     )
 
-    # Fetch from LI.FI
-    try:
-        resp = await async_client.get("/v1/quote", params=req.model_dump())
-        resp.raise_for_status()
-        raw_quote_data = resp.json()
-    except httpx.HTTPStatusError as err:
-        detail = err.response.text if err.response is not None else str(err)
-        raise HTTPException(status_code=err.response.status_code, detail=f"LI.FI error: {detail}")
-    except Exception as err:
-        raise HTTPException(status_code=502, detail=f"Upstream failure: {str(err)}")
+    entry = await quote_service.get(req)
+
+    headers = quote_cache_headers(entry)
+    etag = quote_etag("detailed", req, entry)
+    if etag_matches(request, etag):
+        return not_modified(etag, headers)
+    headers["ETag"] = etag
 
-    # Parse the data
-    clean_summary = parse_quote(raw_quote_data)
+    cached = detailed_bodies.get(etag)
+    if cached is not None:
+        return precompressed_response(request, *cached, headers)
+
+    clean_summary = entry["summary"]
     
     # Get AI summary
-    ai_response = await asyncio.get_event_loop().run_in_executor(None, chain.invoke, clean_summary)
+    ai_summary = await summarize_quote(clean_summary)
     
     # Extract route steps
     steps = []
-    for step in raw_quote_data.get("includedSteps", []):
+    for step in quote_data(entry).get("includedSteps", []):
         steps.append(RouteStep(
             tool=step.get("tool", "unknown"),
-            from_chain=step.get("action", {}).get("fromChainId", ""),
-            to_chain=step.get("action", {}).get("toChainId", ""),
+            from_chain=str(step.get("action", {}).get("fromChainId", "")),
+            to_chain=str(step.get("action", {}).get("toChainId", "")),
             from_token=step.get("action", {}).get("fromToken", {}).get("symbol", ""),
             to_token=step.get("action", {}).get("toToken", {}).get("symbol", ""),
             estimated_time=step.get("estimate", {}).get("executionDuration", 0)
         ))
     
-    return {
-        "summary": ai_response.content,
+    body = orjson.dumps({
+        "summary": ai_summary,
+        "stale": entry["stale"],
         "provider": clean_summary.get("provider"),
         "time_seconds": clean_summary.get("time_seconds"),
         "fees_usd": clean_summary.get("fees_usd"),
@@ -537,28 +1011,48 @@ async def get_detailed_quote(
         "price_impact": clean_summary.get("price_impact"),
         "gas_cost_usd": clean_summary.get("gas_cost_usd"),
         "route_steps": [step.model_dump() for step in steps],
-        "raw_data": raw_quote_data  # Include full data for advanced users
-    }
+    })
+    # Include full data for advanced users: LI.FI's own bytes, spliced in
+    # as the last field instead of being re-encoded
+    body = body[:-1] + b',"raw_data":' + entry["raw"].encode() + b"}"
+
+    cached = detailed_bodies[etag] = (body, gzip.compress(body, compresslevel=6))
+    return precompressed_response(request, *cached, headers)
 
 # ============= NEW ENDPOINTS: SIWE Auth + Transaction History =============
 
+# Optional write-behind batching: transaction inserts and status updates are
+# grouped into one commit per batch (flushed within DB_WRITE_MAX_DELAY seconds)
+tx_writer: Optional[repositories.BatchedTransactionWriter] = None
+if os.getenv("DB_WRITE_BATCHING", "false").lower() == "true":
+    tx_writer = repositories.BatchedTransactionWriter(
+        AsyncSessionLocal,
+        max_batch=int(os.getenv("DB_WRITE_MAX_BATCH", "100")),
+        max_delay=float(os.getenv("DB_WRITE_MAX_DELAY", "0.01")),
+    )
+
+# Optional confirmation poller: pending transactions are checked against the
+# JSON-RPC endpoints in RPC_URLS ("<chain_id>=<url>,...") and resolved in place
+RPC_URLS = parse_rpc_urls(os.getenv("RPC_URLS", ""))
+confirmation_poller: Optional[ConfirmationPoller] = None
+if RPC_URLS:
+    confirmation_poller = ConfirmationPoller(
+        AsyncSessionLocal,
+        batch_size=int(os.getenv("CONFIRMATION_BATCH_SIZE", "200")),
+        min_interval=float(os.getenv("CONFIRMATION_MIN_INTERVAL", "5")),
+        max_interval=float(os.getenv("CONFIRMATION_MAX_INTERVAL", "120")),
+    )
+
 @app.post("/api/v1/auth/nonce")
-async def get_nonce(request: NonceRequest, db: Session = Depends(get_db)):
+async def get_nonce(request: NonceRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Generate a nonce for SIWE (Sign-In with Ethereum) authentication.
     Frontend will sign this nonce with their private key.
     """
     nonce = secrets.token_hex(16)
     
-    # Check if session exists for this address
-    session = db.query(UserSession).filter(UserSession.address == request.address).first()
-    if not session:
-        session = UserSession(address=request.address, nonce=nonce)
-        db.add(session)
-    else:
-        session.nonce = nonce
-    
-    db.commit()
+    # Create or update the session for this address
+    await repositories.set_session_nonce(db, request.address, nonce)
     
     return NonceResponse(
         nonce=nonce,
@@ -566,13 +1060,13 @@ async def get_nonce(request: NonceRequest, db: Session = Depends(get_db)):
     )
 
 @app.post("/api/v1/auth/verify")
-async def verify_signature(request: VerifyMessageRequest, db: Session = Depends(get_db)):
+async def verify_signature(request: VerifyMessageRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Verify SIWE signature and authenticate user.
     In production, use proper SIWE library to verify.
     """
     # Get session
-    session = db.query(UserSession).filter(UserSession.address == request.address).first()
+    session = await repositories.get_session_by_address(db, request.address)
     if not session:
         raise HTTPException(status_code=404, detail="No nonce found. Call /api/v1/auth/nonce first.")
     
@@ -582,8 +1076,7 @@ async def verify_signature(request: VerifyMessageRequest, db: Session = Depends(
         raise HTTPException(status_code=400, detail="Invalid signature")
     
     # Mark as authenticated
-    session.is_authenticated = True
-    db.commit()
+    await repositories.mark_session_authenticated(db, session)
     
     return {
         "status": "authenticated",
@@ -594,13 +1087,14 @@ async def verify_signature(request: VerifyMessageRequest, db: Session = Depends(
 @app.post("/api/v1/transactions/submit")
 async def submit_transaction(
     tx: TransactionSubmission,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Submit a completed transaction to store in history.
     """
     # Rate limiting
-    if not tx_limiter.is_allowed(tx.user_address):
+    if not await tx_limiter.acquire(tx.user_address):
+        metrics.rate_limited("transactions")
         raise HTTPException(status_code=429, detail="Rate limit exceeded. Max 10 transactions/minute")
     
     # Validate address format (basic)
@@ -608,10 +1102,9 @@ async def submit_transaction(
         raise HTTPException(status_code=400, detail="Invalid address format")
     
     # Validate chain IDs
-    allowed_chains = [1, 137, 42161, 10, 8453, 11155111, 421614, 11155420, 84532]
-    if not validate_chain_id(tx.from_chain_id, allowed_chains):
+    if not validate_chain_id(tx.from_chain_id, catalog.chain_ids):
         raise HTTPException(status_code=400, detail="Invalid from_chain_id")
-    if not validate_chain_id(tx.to_chain_id, allowed_chains):
+    if not validate_chain_id(tx.to_chain_id, catalog.chain_ids):
         raise HTTPException(status_code=400, detail="Invalid to_chain_id")
     
     # Validate amounts
@@ -621,7 +1114,7 @@ async def submit_transaction(
         raise HTTPException(status_code=400, detail="Invalid to_amount")
     
     # Create transaction record
-    transaction = TransactionHistory(
+    fields = dict(
         user_address=tx.user_address,
         from_chain_id=tx.from_chain_id,
         to_chain_id=tx.to_chain_id,
@@ -630,12 +1123,17 @@ async def submit_transaction(
         from_amount=tx.from_amount,
         to_amount=tx.to_amount,
         tx_hash=tx.tx_hash,
-        status="pending"  # Will be updated via block explorer polling
+        status="pending"  # Resolved by the confirmation poller
     )
-    
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    try:
+        if tx_writer is not None:
+            transaction = await tx_writer.create_transaction(**fields)
+        else:
+            transaction = await repositories.create_transaction(db, **fields)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Transaction already submitted")
+    if confirmation_poller is not None:
+        confirmation_poller.wake()
     
     return {
         "id": transaction.id,
@@ -647,25 +1145,35 @@ async def submit_transaction(
 @app.get("/api/v1/transactions/history")
 async def get_transaction_history(
     address: str = Query(...),
-    limit: int = Query(default=50, le=100),
-    db: Session = Depends(get_db)
+    limit: int = Query(default=50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get transaction history for a user address.
+    Get transaction history for a user address, newest first.
+    Pass next_cursor back as cursor to fetch the following page.
     """
     # Validate address format
     if not address.startswith("0x") or len(address) != 42:
         raise HTTPException(status_code=400, detail="Invalid address format")
     
-    transactions = db.query(TransactionHistory)\
-        .filter(TransactionHistory.user_address == address)\
-        .order_by(TransactionHistory.created_at.desc())\
-        .limit(limit)\
-        .all()
+    before = None
+    if cursor:
+        try:
+            before = repositories.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Fetch one extra row to know whether another page exists
+    transactions = await repositories.list_transactions(db, address, limit=limit + 1, before=before)
+    has_more = len(transactions) > limit
+    transactions = transactions[:limit]
     
     return {
         "address": address,
         "count": len(transactions),
+        "has_more": has_more,
+        "next_cursor": repositories.encode_cursor(transactions[-1]) if has_more else None,
         "transactions": [
             {
                 "id": tx.id,
@@ -688,27 +1196,93 @@ async def get_transaction_history(
 async def update_transaction_status(
     tx_hash: str,
     status: str = Query(..., pattern="^(pending|completed|failed)$"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Update transaction status (called by backend block explorer poller).
+    Update transaction status (for external pollers; see also RPC_URLS).
     """
-    transaction = db.query(TransactionHistory).filter(
-        TransactionHistory.tx_hash == tx_hash
-    ).first()
+    if tx_writer is not None:
+        transaction = await tx_writer.update_transaction_status(tx_hash, status)
+    else:
+        transaction = await repositories.update_transaction_status(db, tx_hash, status)
     
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    transaction.status = status
-    if status == "completed":
-        from datetime import datetime
-        transaction.confirmed_at = datetime.utcnow()
-    
-    db.commit()
-    
     return {
         "tx_hash": transaction.tx_hash,
         "status": transaction.status,
         "confirmed_at": transaction.confirmed_at
     }
+
+def stats_view(counters: dict) -> dict:
+    """Turn TransactionStats counters into the figures shown on the dashboard"""
+    resolved = counters["completed_count"] + counters["failed_count"]
+    return {
+        "transactions": counters["tx_count"],
+        "pending": counters["pending_count"],
+        "completed": counters["completed_count"],
+        "failed": counters["failed_count"],
+        "volume": round(counters["volume"], 6),
+        "success_rate": round(counters["completed_count"] / resolved, 4) if resolved else None,
+        "avg_fees": round(counters["fees_total"] / counters["fees_count"], 8) if counters["fees_count"] else None,
+        "avg_confirmation_seconds": (
+            round(counters["confirmation_seconds_total"] / counters["confirmation_count"], 1)
+            if counters["confirmation_count"] else None
+        ),
+    }
+
+@app.get("/api/v1/analytics")
+async def get_analytics(
+    address: Optional[str] = Query(None, description="Wallet address; omit for global analytics"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Transaction analytics per chain pair and in total, for one wallet or all.
+    Read from aggregates maintained on every write, so the cost does not
+    grow with the size of the history.
+    """
+    if address is not None and not validate_ethereum_address(address):
+        raise HTTPException(status_code=400, detail="Invalid address format")
+
+    rows = await repositories.get_transaction_stats(db, address or repositories.ALL_WALLETS)
+    rows.sort(key=lambda row: row.tx_count, reverse=True)
+    totals = {counter: sum(getattr(row, counter) for row in rows) for counter in repositories.STATS_COUNTERS}
+
+    return {
+        "scope": address or "all",
+        "totals": stats_view(totals),
+        "chain_pairs": [
+            {
+                "from_chain_id": row.from_chain_id,
+                "to_chain_id": row.to_chain_id,
+                **stats_view({counter: getattr(row, counter) for counter in repositories.STATS_COUNTERS})
+            }
+            for row in rows
+        ]
+    }
+
+# Upper bound on updates per bulk request
+BULK_STATUS_MAX_ITEMS = 5000
+
+@app.patch("/api/v1/transactions/status/bulk")
+async def bulk_update_transaction_status(
+    updates: list[TransactionStatusUpdate],
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Update many transaction statuses in one database transaction
+    (for the block explorer poller). Returns the outcome per tx_hash.
+    """
+    if len(updates) > BULK_STATUS_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maximum {BULK_STATUS_MAX_ITEMS} updates per request")
+
+    outcomes = await repositories.bulk_update_transaction_status(
+        db, [update.model_dump() for update in updates]
+    )
+
+    return {
+        "updated": sum(1 for outcome in outcomes.values() if outcome == "updated"),
+        "not_found": sum(1 for outcome in outcomes.values() if outcome == "not_found"),
+        "results": [{"tx_hash": tx_hash, "outcome": outcome} for tx_hash, outcome in outcomes.items()]
+    }
@@ -0,0 +1,158 @@
+"""
+Prometheus metrics for ChainCompass API
+
+Latency histograms for each stage of a request (LI.FI fetches and their
+retries, quote parsing, LLM calls, database queries) plus rate limiter
+rejections, served in Prometheus text format at /metrics.
+
+Samples are labeled with the endpoint (route template) and chain pair of the
+request they belong to. Both are context variables: MetricsMiddleware sets
+the endpoint and QuoteService the chain pair, so code deep in the call stack
+doesn't have to pass them along. Work outside a request is labeled
+"background".
+
+With several workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+(wipe it on every deploy) in the environment of the server process. Each
+worker then writes its samples there and /metrics aggregates all of them,
+whichever worker answers the scrape.
+"""
+import os
+import time
+from contextvars import ContextVar
+
+# prometheus_client switches to multiprocess mode whenever the variable is
+# set, so an empty value (PROMETHEUS_MULTIPROC_DIR= in a .env file) would
+# point it at the current directory
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from starlette.routing import Match
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+BACKGROUND = "background"
+UNMATCHED = "unmatched"  # keeps unknown paths from creating label values
+
+endpoint_var: ContextVar[str] = ContextVar("metrics_endpoint", default=BACKGROUND)
+chain_pair_var: ContextVar[str] = ContextVar("metrics_chain_pair", default="none")
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "chaincompass_http_request_duration_seconds", "Time to answer an HTTP request",
+    ["endpoint", "method", "status"],
+)
+LIFI_FETCH_SECONDS = Histogram(
+    "chaincompass_lifi_fetch_duration_seconds", "LI.FI request latency per attempt",
+    ["endpoint", "chain_pair", "kind", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30),
+)
+LIFI_RETRIES = Histogram(
+    "chaincompass_lifi_fetch_retries", "Retries needed per LI.FI fetch",
+    ["endpoint", "chain_pair", "kind"],
+    buckets=(0, 1, 2, 3, 5),
+)
+PARSE_SECONDS = Histogram(
+    "chaincompass_parse_duration_seconds", "Time to decode a LI.FI response and extract its fields (parse_quote)",
+    ["endpoint", "chain_pair", "kind"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+LLM_SECONDS = Histogram(
+    "chaincompass_llm_duration_seconds", "Time to generate an AI summary (cache misses only)",
+    ["endpoint", "chain_pair", "mode"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+DB_QUERY_SECONDS = Histogram(
+    "chaincompass_db_query_duration_seconds", "Database statement execution time",
+    ["endpoint", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "chaincompass_rate_limit_rejections", "Requests rejected by a rate limiter",
+    ["endpoint", "limiter"],
+)
+
+DB_OPERATIONS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA"})
+
+
+# --- Labels ---
+
+def endpoint() -> str:
+    return endpoint_var.get()
+
+
+def chain_pair() -> str:
+    return chain_pair_var.get()
+
+
+def set_chain_pair(from_chain, to_chain) -> None:
+    """Label the rest of the current request (or task) with a chain pair"""
+    chain_pair_var.set(f"{from_chain}-{to_chain}")
+
+
+def rate_limited(limiter: str) -> None:
+    RATE_LIMIT_REJECTIONS.labels(endpoint(), limiter).inc()
+
+
+# --- Instrumentation ---
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that labels each request with its route template (e.g.
+    /api/v1/transactions/{user_address}) and records its duration and status.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route_path = UNMATCHED
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                route_path = route.path
+                break
+        endpoint_var.set(route_path)
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(route_path, scope["method"], status).observe(time.perf_counter() - started)
+
+
+def instrument_engine(sync_engine) -> None:
+    """Time every statement run on an engine (pass async_engine.sync_engine for async engines)"""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        words = statement.split(None, 1)
+        operation = words[0].upper() if words else ""
+        DB_QUERY_SECONDS.labels(endpoint(), operation if operation in DB_OPERATIONS else "OTHER").observe(
+            time.perf_counter() - context._metrics_started
+        )
+
+
+# --- Exposition ---
+
+def render() -> bytes:
+    """Every metric in Prometheus text format, aggregated over workers in multiprocess mode"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,307 @@
+"""
+Shared LI.FI quote fetching for ChainCompass API
+
+Every endpoint that needs a quote (summary, detailed, compare, routes) goes
+through one QuoteService, so they share a single cache, retry policy and set
+of counters. Fetching the detailed view of a quote that was just summarized
+costs nothing upstream.
+"""
+import asyncio
+import time
+from typing import Any, Callable, Optional
+
+import httpx
+import orjson
+from fastapi import HTTPException
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential, retry_if_exception_type
+
+import metrics
+from cache import CacheBackend, HotKeyTracker, QuoteKeyNormalizer, SingleFlight
+from validation import RateLimiter, validate_ethereum_address, validate_amount
+
+# Retry policy for LI.FI requests (transient network errors only)
+RETRY_ATTEMPTS = 3
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+
+def quote_data(entry: dict) -> dict:
+    """Decode the full LI.FI response held by a cache entry (only views that need the whole tree)"""
+    return orjson.loads(entry["raw"])
+
+
+class QuoteService:
+    """
+    Fetch LI.FI quotes through the quote cache with retries, request
+    coalescing and stale-while-revalidate.
+
+    Cache entries look like {"raw": <LI.FI response text>, "summary":
+    <extracted fields>, "fetched_at": <unix time>}. The decoded response is
+    only used to run the extractor for its kind (e.g. parse_quote) when it
+    arrives and is then dropped: a JSON string is a fraction of the size of
+    the nested dicts, most views only need the summary, and "raw" can be
+    passed through as is. quote_data(entry) decodes the full tree on demand.
+    Entries older than soft_ttl are still served, marked stale, while a
+    background task refreshes them; the cache's own TTL is the hard expiry.
+    """
+    def __init__(
+        self,
+        cache: CacheBackend,
+        keys: QuoteKeyNormalizer,
+        limiter: RateLimiter,
+        soft_ttl: float = 30,
+        refresh_interval: float = 5,
+        refresh_top_n: int = 20,
+        hot_window: float = 120,
+        extractors: Optional[dict[str, Callable[[dict], Any]]] = None,
+    ):
+        self.cache = cache
+        self.extractors = extractors or {}
+        self.keys = keys
+        self.limiter = limiter
+        self.soft_ttl = soft_ttl
+        self.refresh_interval = refresh_interval
+        self.refresh_top_n = refresh_top_n
+        self.client: Optional[httpx.AsyncClient] = None
+        self.flights = SingleFlight()
+        self.hot = HotKeyTracker(maxsize=512, window=hot_window)
+        self.background_tasks: set[asyncio.Task] = set()
+        self._refresher: Optional[asyncio.Task] = None
+
+        self.request_count = 0
+        self.route_requests = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stale_served = 0
+        self.background_refreshes = 0
+        self.refresh_failures = 0
+
+    # --- Lifecycle ---
+
+    def start(self, client: httpx.AsyncClient) -> None:
+        """Attach the pooled HTTP client and start refreshing hot quotes"""
+        self.client = client
+        if self.refresh_interval > 0 and self.refresh_top_n > 0:
+            self._refresher = asyncio.create_task(self.refresh_hot_quotes())
+
+    def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        for task in list(self.background_tasks):
+            task.cancel()
+        self.client = None
+
+    # --- Lookups ---
+
+    def cache_key(self, req) -> tuple:
+        return self.keys.key(req.fromChain, req.toChain, req.fromToken, req.toToken, req.fromAmount, req.fromAddress)
+
+    def routes_body(self, req) -> dict:
+        """Request body for LI.FI /v1/advanced/routes (chains must be numeric ids)"""
+        try:
+            from_chain, to_chain = int(self.keys.chain(req.fromChain)), int(self.keys.chain(req.toChain))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Unknown chain")
+        return {
+            "fromChainId": from_chain,
+            "toChainId": to_chain,
+            # Addresses when the catalog knows the symbol
+            "fromTokenAddress": self.keys.token(req.fromToken, str(from_chain)),
+            "toTokenAddress": self.keys.token(req.toToken, str(to_chain)),
+            "fromAmount": req.fromAmount,
+            "fromAddress": req.fromAddress,
+        }
+
+    async def _admit(self, req) -> None:
+        """Readiness, rate limit and input checks shared by every lookup"""
+        if self.client is None:
+            raise HTTPException(status_code=503, detail="HTTP client not ready")
+
+        # Rate limiting
+        if not await self.limiter.acquire(req.fromAddress):
+            metrics.rate_limited("quote")
+            raise HTTPException(status_code=429, detail="Rate limit exceeded. Max 50 requests/minute")
+
+        # Validate inputs
+        catalog = self.keys.catalog
+        if catalog is not None and (catalog.chain_id(req.fromChain) is None or catalog.chain_id(req.toChain) is None):
+            raise HTTPException(status_code=400, detail="Unsupported chain")
+
+        if not validate_ethereum_address(req.fromAddress):
+            raise HTTPException(status_code=400, detail="Invalid Ethereum address")
+
+        if not validate_amount(req.fromAmount):
+            raise HTTPException(status_code=400, detail="Invalid amount. Must be between 0.001 and 1,000,000")
+
+    async def get(self, req) -> dict:
+        """
+        Look up the quote for a QuoteRequest, fetching from LI.FI on a miss.
+        Returns {"raw", "summary", "fetched_at", "stale"}. Raises HTTPException on failure.
+        """
+        await self._admit(req)
+        self.request_count += 1
+
+        cache_key = self.cache_key(req)
+        self.hot.touch(cache_key, req)
+
+        entry = await self.cache.aget(cache_key)
+        self.keys.record(req.model_dump().values(), hit=entry is not None)
+        return await self._serve(req, cache_key, entry, "quote")
+
+    async def get_routes(self, req) -> dict:
+        """
+        Look up all alternative routes for a QuoteRequest (LI.FI advanced
+        routes), cached alongside quotes. Same return value as get().
+        """
+        await self._admit(req)
+        self.routes_body(req)  # reject unknown chains before touching the cache
+        self.request_count += 1
+        self.route_requests += 1
+
+        cache_key = ("routes",) + self.cache_key(req)
+        return await self._serve(req, cache_key, await self.cache.aget(cache_key), "routes")
+
+    async def _serve(self, req, cache_key: tuple, entry: Optional[dict], kind: str) -> dict:
+        if entry is not None and "raw" not in entry:
+            entry = None  # written by an older version to a shared cache
+        metrics.set_chain_pair(self.keys.chain(req.fromChain), self.keys.chain(req.toChain))
+        if entry is not None:
+            self.cache_hits += 1
+            stale = time.time() - entry["fetched_at"] >= self.soft_ttl
+            if stale:
+                self.stale_served += 1
+                self.schedule_refresh(req, cache_key, kind)
+            return dict(entry, stale=stale)
+
+        self.cache_misses += 1
+        try:
+            entry = await self.fetch_upstream(req, cache_key, kind)
+        except HTTPException:
+            raise
+        except httpx.HTTPStatusError as err:
+            detail = err.response.text if err.response is not None else str(err)
+            status = err.response.status_code if err.response is not None else 502
+            raise HTTPException(status_code=status, detail=f"LI.FI error: {detail}")
+        except RETRYABLE_ERRORS as err:
+            raise HTTPException(status_code=504, detail=f"Upstream timeout: {str(err)}")
+        except Exception as err:
+            raise HTTPException(status_code=502, detail=f"Upstream failure: {str(err)}")
+        return dict(entry, stale=False)
+
+    async def fetch_upstream(self, req, cache_key: tuple, kind: str = "quote") -> dict:
+        """
+        Fetch a quote (kind "quote") or its alternative routes (kind "routes")
+        from LI.FI with retries and store it in the cache. Concurrent calls
+        for the same key share one request.
+        """
+        client = self.client
+        if client is None:
+            raise HTTPException(status_code=503, detail="HTTP client not ready")
+
+        labels = (metrics.endpoint(), metrics.chain_pair(), kind)
+
+        async def fetch() -> httpx.Response:
+            started = time.perf_counter()
+            status = "error"
+            try:
+                if kind == "routes":
+                    resp = await client.post("/v1/advanced/routes", json=self.routes_body(req))
+                else:
+                    resp = await client.get("/v1/quote", params=req.model_dump())
+                status = str(resp.status_code)
+            finally:
+                metrics.LIFI_FETCH_SECONDS.labels(*labels, status).observe(time.perf_counter() - started)
+            resp.raise_for_status()
+            return resp
+
+        async def fetch_with_retry() -> dict:
+            attempts = 0
+            try:
+                async for attempt in AsyncRetrying(
+                    reraise=True,
+                    stop=stop_after_attempt(RETRY_ATTEMPTS),
+                    wait=wait_exponential(multiplier=0.5, min=0.5, max=4),
+                    retry=retry_if_exception_type(RETRYABLE_ERRORS)
+                ):
+                    with attempt:
+                        attempts += 1
+                        resp = await fetch()
+            finally:
+                metrics.LIFI_RETRIES.labels(*labels).observe(attempts - 1)
+
+            extract = self.extractors.get(kind)
+            summary = None
+            if extract is not None:
+                with metrics.PARSE_SECONDS.labels(*labels).time():
+                    summary = extract(orjson.loads(resp.content))
+            entry = {"raw": resp.text, "summary": summary, "fetched_at": time.time()}
+            await self.cache.aset(cache_key, entry)
+            return entry
+
+        return await self.flights.do(cache_key, fetch_with_retry)
+
+    # --- Background refresh ---
+
+    def schedule_refresh(self, req, cache_key: tuple, kind: str = "quote") -> None:
+        """Refresh a cache entry in the background unless a fetch is already running"""
+        if cache_key in self.flights:
+            return
+        task = asyncio.create_task(self._refresh(req, cache_key, kind))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def _refresh(self, req, cache_key: tuple, kind: str = "quote") -> None:
+        # The task copied the context of the request that scheduled it
+        metrics.endpoint_var.set(metrics.BACKGROUND)
+        metrics.set_chain_pair(self.keys.chain(req.fromChain), self.keys.chain(req.toChain))
+        try:
+            await self.fetch_upstream(req, cache_key, kind)
+            self.background_refreshes += 1
+        except Exception as err:
+            self.refresh_failures += 1
+            print(f"⚠️ Background refresh failed for {cache_key}: {err}")
+
+    async def refresh_hot_quotes(self) -> None:
+        """Refresh the most-requested quotes before they go stale"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_hot_once()
+            except Exception as err:
+                self.refresh_failures += 1
+                print(f"⚠️ Hot quote refresh pass failed: {err}")
+
+    async def refresh_hot_once(self) -> None:
+        now = time.time()
+        for cache_key, req in self.hot.top(self.refresh_top_n):
+            entry = await self.cache.aget(cache_key)
+            if entry is not None and ("raw" not in entry or "fetched_at" not in entry):
+                entry = None  # written by an older version to a shared cache
+            # Refresh anything that would go stale before the next pass
+            if entry is None or now - entry["fetched_at"] + self.refresh_interval >= self.soft_ttl:
+                self.schedule_refresh(req, cache_key)
+
+    # --- Stats ---
+
+    def stats(self) -> dict:
+        hit_rate = (self.cache_hits / self.request_count) * 100 if self.request_count else 0.0
+        return {
+            "requests": {
+                "total": self.request_count,
+                "routes": self.route_requests,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "hit_rate": f"{hit_rate:.1f}%",
+                "coalesced": self.flights.coalesced
+            },
+            "upstream": self.flights.stats(),
+            "key_normalization": self.keys.stats(),
+            "freshness": {
+                "soft_ttl": f"{self.soft_ttl:g}s",
+                "hard_ttl": f"{self.cache.ttl:g}s",
+                "stale_served": self.stale_served,
+                "background_refreshes": self.background_refreshes,
+                "refresh_failures": self.refresh_failures,
+                "hot_keys": len(self.hot)
+            },
+        }
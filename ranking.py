@@ -0,0 +1,85 @@
+"""
+Route ranking for ChainCompass API
+
+Candidate routes are scored together: their metrics are packed into one
+matrix and every weight profile is a single matrix-vector product, so
+ranking hundreds of alternatives is a handful of NumPy operations.
+"""
+from typing import Iterable
+
+import numpy as np
+
+# Column order of the metric matrix
+METRICS = ("output_usd", "fees_usd", "time_seconds", "price_impact")
+
+# Weight per metric for each profile (positive rewards, negative penalizes).
+# "balanced" keeps the original calculate_route_score weights.
+WEIGHT_PROFILES = {
+    "balanced": {"output_usd": 10, "fees_usd": -20, "time_seconds": -0.1, "price_impact": -5},
+    "cheapest": {"output_usd": 10, "fees_usd": -60, "time_seconds": -0.02, "price_impact": -5},
+    "fastest": {"output_usd": 10, "fees_usd": -10, "time_seconds": -1.0, "price_impact": -2},
+    "lowest_impact": {"output_usd": 10, "fees_usd": -10, "time_seconds": -0.05, "price_impact": -50},
+}
+
+_WEIGHTS = {
+    name: np.array([weights[metric] for metric in METRICS], dtype=np.float64)
+    for name, weights in WEIGHT_PROFILES.items()
+}
+
+
+def metric_matrix(routes: Iterable) -> np.ndarray:
+    """
+    (n, len(METRICS)) float matrix from QuoteSummary-like objects or dicts.
+    Missing metrics count as 0 and price impact is taken as an absolute value.
+    """
+    rows = [
+        [(route.get(metric) if isinstance(route, dict) else getattr(route, metric, None)) or 0.0 for metric in METRICS]
+        for route in routes
+    ]
+    matrix = np.array(rows, dtype=np.float64).reshape(-1, len(METRICS))
+    matrix[:, 3] = np.abs(matrix[:, 3])
+    return matrix
+
+
+def score_routes(matrix: np.ndarray, profile: str = "balanced") -> np.ndarray:
+    """Score every row of a metric matrix (higher is better, floored at 0)"""
+    if profile not in _WEIGHTS:
+        raise ValueError(f"Unknown ranking profile: {profile}")
+    return np.maximum(matrix @ _WEIGHTS[profile], 0.0)
+
+
+def pareto_front(matrix: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of routes not dominated on (output, fees, time): no other
+    route is at least as good on all three and strictly better on one.
+    """
+    costs = np.column_stack((-matrix[:, 0], matrix[:, 1], matrix[:, 2]))
+    # Visit routes in lexicographic cost order: each one visited removes
+    # everything it dominates, and strong routes come first, so the work is
+    # about O(n * front size) rather than comparing every pair
+    candidates = np.lexsort(costs.T[::-1])
+    costs = costs[candidates]
+    i = 0
+    while i < len(costs):
+        keep = (costs < costs[i]).any(axis=1) | (costs == costs[i]).all(axis=1)
+        candidates, costs = candidates[keep], costs[keep]
+        i = int(keep[:i].sum()) + 1
+    front = np.zeros(len(matrix), dtype=bool)
+    front[candidates] = True
+    return front
+
+
+def rank_routes(routes: list, profile: str = "balanced", pareto_only: bool = False) -> list[tuple[int, float, bool]]:
+    """
+    Rank routes best first. Returns (index into routes, score, on Pareto front)
+    tuples; with pareto_only, dominated routes are dropped. Ties keep input order.
+    """
+    if not routes:
+        return []
+    matrix = metric_matrix(routes)
+    scores = score_routes(matrix, profile)
+    front = pareto_front(matrix)
+    order = np.argsort(-scores, kind="stable")
+    if pareto_only:
+        order = order[front[order]]
+    return [(int(i), float(scores[i]), bool(front[i])) for i in order]
@@ -0,0 +1,186 @@
+"""
+Chain and token catalog for ChainCompass API
+
+Loads LI.FI's /v1/chains and /v1/tokens catalogs, keeps a snapshot on disk
+so a cold start works offline, and refreshes them in the background. Every
+lookup (endpoints, validation, quote cache keys) goes through dict indexes
+rebuilt once per refresh.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Iterable, Optional
+
+import httpx
+
+
+class CatalogRegistry:
+    """
+    In-memory chain/token catalog with O(1) lookups:
+
+    - chain id, LI.FI key or name ("1", "eth", "Ethereum") -> chain id
+    - chain id -> chain
+    - (chain id, symbol or address) -> token
+
+    Until the first snapshot or refresh, only `fallback_chains` are known.
+    `extra_chain_ids` (e.g. testnets LI.FI doesn't list) are accepted by
+    chain_ids without having catalog entries.
+    """
+    def __init__(
+        self,
+        snapshot_path: Optional[str] = None,
+        refresh_interval: float = 21600,
+        fallback_chains: Optional[list[dict]] = None,
+        extra_chain_ids: Iterable[int] = (),
+    ):
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.extra_chain_ids = frozenset(extra_chain_ids)
+        self.fetched_at = 0.0
+        self.source = "fallback"
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self.version = 0  # bumped whenever the indexes are rebuilt
+
+        self._index(fallback_chains or [], {})
+        if snapshot_path:
+            self.load_snapshot()
+
+    # --- Indexes ---
+
+    def _index(self, chains: list[dict], tokens: dict) -> None:
+        """Build every lookup index, then swap them in together"""
+        chains_by_id = {int(chain["id"]): chain for chain in chains}
+        aliases = {}
+        for chain in chains:
+            for alias in (chain["id"], chain.get("key"), chain.get("name")):
+                if alias:
+                    aliases[str(alias).lower()] = int(chain["id"])
+
+        tokens_by_symbol: dict[int, dict[str, dict]] = {}
+        tokens_by_address: dict[int, dict[str, dict]] = {}
+        for chain_id, chain_tokens in tokens.items():
+            by_symbol = tokens_by_symbol.setdefault(int(chain_id), {})
+            by_address = tokens_by_address.setdefault(int(chain_id), {})
+            for token in chain_tokens:
+                # LI.FI lists the canonical token first when symbols collide
+                by_symbol.setdefault(token.get("symbol", "").upper(), token)
+                by_address[token.get("address", "").lower()] = token
+
+        self.chains = chains_by_id
+        self.chain_aliases = aliases
+        self.chain_ids = frozenset(chains_by_id) | self.extra_chain_ids
+        self.tokens = tokens
+        self._tokens_by_symbol = tokens_by_symbol
+        self._tokens_by_address = tokens_by_address
+        self.version += 1
+
+    # --- Lookups ---
+
+    def chain_id(self, value) -> Optional[int]:
+        """Chain id for an id, LI.FI key or name; None if unknown"""
+        return self.chain_aliases.get(str(value).strip().lower())
+
+    def chain(self, chain_id: int) -> Optional[dict]:
+        return self.chains.get(chain_id)
+
+    def token(self, chain_id: int, value: str) -> Optional[dict]:
+        """Token on a chain by symbol or address; None if unknown"""
+        value = value.strip()
+        if value.lower().startswith("0x"):
+            return self._tokens_by_address.get(chain_id, {}).get(value.lower())
+        return self._tokens_by_symbol.get(chain_id, {}).get(value.upper())
+
+    def chain_tokens(self, chain_id: int) -> list[dict]:
+        return list(self._tokens_by_address.get(chain_id, {}).values())
+
+    def token_address(self, chain_id: int, value: str) -> Optional[str]:
+        token = self.token(chain_id, value)
+        return token.get("address") if token is not None else None
+
+    # --- Snapshot ---
+
+    def load_snapshot(self) -> bool:
+        """Load the on-disk snapshot if there is one; returns whether it was used"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            self._index(snapshot["chains"], snapshot["tokens"])
+        except Exception as err:
+            print(f"⚠️ Ignoring unreadable catalog snapshot {self.snapshot_path}: {err}")
+            return False
+        self.fetched_at = snapshot.get("fetched_at", 0.0)
+        self.source = "snapshot"
+        return True
+
+    def save_snapshot(self) -> None:
+        """
+        Write the catalog atomically so a crash never leaves a partial file.
+        Each write gets its own temp file, as every worker saves a snapshot
+        after refreshing.
+        """
+        if not self.snapshot_path:
+            return
+        directory, name = os.path.split(os.path.abspath(self.snapshot_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"fetched_at": self.fetched_at, "chains": list(self.chains.values()), "tokens": self.tokens}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    # --- Refresh ---
+
+    async def refresh(self, client: httpx.AsyncClient) -> None:
+        """Reload both catalogs from LI.FI and persist them"""
+        resp = await client.get("/v1/chains")
+        resp.raise_for_status()
+        chains = resp.json().get("chains", [])
+
+        resp = await client.get("/v1/tokens", params={"chains": ",".join(str(chain["id"]) for chain in chains)})
+        resp.raise_for_status()
+        tokens = resp.json().get("tokens", {})
+
+        self._index(chains, tokens)
+        self.fetched_at = time.time()
+        self.source = "lifi"
+        self.refreshes += 1
+        await asyncio.to_thread(self.save_snapshot)
+
+    def start(self, client: httpx.AsyncClient) -> None:
+        """Refresh now if the catalog is older than refresh_interval, then periodically"""
+        self._task = asyncio.create_task(self._run(client))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, client: httpx.AsyncClient) -> None:
+        delay = max(0.0, self.fetched_at + self.refresh_interval - time.time())
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh(client)
+                delay = self.refresh_interval
+            except Exception as err:
+                self.refresh_failures += 1
+                print(f"⚠️ Catalog refresh failed, keeping {self.source} catalog: {err}")
+                delay = min(self.refresh_interval, 60)
+
+    def stats(self) -> dict:
+        return {
+            "source": self.source,
+            "chains": len(self.chains),
+            "tokens": sum(len(chain_tokens) for chain_tokens in self.tokens.values()),
+            "age_seconds": round(time.time() - self.fetched_at) if self.fetched_at else None,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
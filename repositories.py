@@ -0,0 +1,499 @@
+"""
+Async data access for ChainCompass API
+
+All functions take an AsyncSession (see database.get_async_db) so database
+I/O never blocks the event loop.
+"""
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import bindparam, func, or_, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import TransactionHistory, TransactionStats, UserSession, WorkerLease
+
+
+# --- Sessions (SIWE auth) ---
+
+async def get_session_by_address(db: AsyncSession, address: str) -> Optional[UserSession]:
+    result = await db.execute(select(UserSession).where(UserSession.address == address))
+    return result.scalars().first()
+
+async def set_session_nonce(db: AsyncSession, address: str, nonce: str) -> UserSession:
+    """Create the session for address, or replace its nonce"""
+    session = await get_session_by_address(db, address)
+    if session is None:
+        session = UserSession(address=address, nonce=nonce)
+        db.add(session)
+    else:
+        session.nonce = nonce
+    await db.commit()
+    return session
+
+async def mark_session_authenticated(db: AsyncSession, session: UserSession) -> UserSession:
+    session.is_authenticated = True
+    await db.commit()
+    return session
+
+
+# --- Worker leases ---
+
+async def acquire_lease(db: AsyncSession, name: str, owner: str, ttl: float) -> bool:
+    """
+    Take or renew the lease `name` for `ttl` seconds. Succeeds if the lease
+    is free, expired or already held by owner; False means another worker
+    holds it.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    result = await db.execute(
+        update(WorkerLease)
+        .where(WorkerLease.name == name, or_(WorkerLease.owner == owner, WorkerLease.expires_at < now))
+        .values(owner=owner, expires_at=expires_at)
+    )
+    if result.rowcount:
+        await db.commit()
+        return True
+    db.add(WorkerLease(name=name, owner=owner, expires_at=expires_at))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Held by another worker (or claimed by one just now)
+        await db.rollback()
+        return False
+    return True
+
+async def release_lease(db: AsyncSession, name: str, owner: str) -> None:
+    """Give up the lease `name` if owner holds it, so another worker can take over at once"""
+    await db.execute(
+        update(WorkerLease)
+        .where(WorkerLease.name == name, WorkerLease.owner == owner)
+        .values(expires_at=datetime.utcnow())
+    )
+    await db.commit()
+
+
+
+# --- Transactions ---
+
+async def create_transaction(db: AsyncSession, **fields) -> TransactionHistory:
+    transaction = TransactionHistory(**fields)
+    db.add(transaction)
+    await db.flush()
+    await apply_stats_changes(db, [(None, stats_fields(transaction))])
+    await db.commit()
+    await db.refresh(transaction)
+    return transaction
+
+async def get_transaction_by_hash(db: AsyncSession, tx_hash: str, for_update: bool = False) -> Optional[TransactionHistory]:
+    query = select(TransactionHistory).where(TransactionHistory.tx_hash == tx_hash)
+    if for_update:
+        # Lock the row and refresh any copy this session already holds
+        query = query.with_for_update().execution_options(populate_existing=True)
+    result = await db.execute(query)
+    return result.scalars().first()
+
+def encode_cursor(transaction: TransactionHistory) -> str:
+    """Opaque keyset cursor pointing just past this transaction"""
+    raw = json.dumps([transaction.created_at.isoformat(), transaction.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        created_at, tx_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(tx_id)
+    except Exception as err:
+        raise ValueError("Invalid cursor") from err
+
+async def list_transactions(
+    db: AsyncSession,
+    user_address: str,
+    limit: int = 50,
+    before: Optional[tuple[datetime, int]] = None,
+) -> list[TransactionHistory]:
+    """
+    Transactions for an address, newest first, using keyset pagination:
+    `before` is the (created_at, id) of the last row of the previous page.
+    Served from the (user_address, created_at, id) index, so the cost is
+    O(limit) however many transactions the wallet has.
+    """
+    query = select(TransactionHistory).where(TransactionHistory.user_address == user_address)
+    if before is not None:
+        query = query.where(
+            tuple_(TransactionHistory.created_at, TransactionHistory.id) < tuple_(*before)
+        )
+    result = await db.execute(
+        query.order_by(TransactionHistory.created_at.desc(), TransactionHistory.id.desc()).limit(limit)
+    )
+    return list(result.scalars().all())
+
+async def update_transaction_status(db: AsyncSession, tx_hash: str, status: str) -> Optional[TransactionHistory]:
+    """Set a transaction's status; returns None if the hash is unknown"""
+    await begin_write(db)
+    transaction = await get_transaction_by_hash(db, tx_hash, for_update=True)
+    if transaction is None:
+        return None
+    before = stats_fields(transaction)
+    transaction.status = status
+    if status == "completed":
+        transaction.confirmed_at = datetime.utcnow()
+    await apply_stats_changes(db, [(before, stats_fields(transaction))])
+    await db.commit()
+    return transaction
+
+async def list_pending_transactions(db: AsyncSession, limit: int = 200, after_id: int = 0) -> list[TransactionHistory]:
+    """Pending transactions with id > after_id, oldest first (for the confirmation poller)"""
+    result = await db.execute(
+        select(TransactionHistory)
+        .where(TransactionHistory.status == "pending", TransactionHistory.id > after_id)
+        .order_by(TransactionHistory.id)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+def utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC datetime, the form every DateTime column is stored in"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+async def bulk_update_transaction_status(db: AsyncSession, updates: list[dict]) -> dict[str, str]:
+    """
+    Apply many status updates in one transaction with a single executemany
+    UPDATE. Each update has tx_hash and status, plus optional confirmed_at,
+    gas_used and fees_paid (left unchanged when None; confirmed_at defaults
+    to now for completed transactions and is converted to naive UTC). Returns {tx_hash: "updated" | "not_found"}.
+    """
+    hashes = list(dict.fromkeys(update["tx_hash"] for update in updates))
+    await begin_write(db)
+    before = {}
+    for start in range(0, len(hashes), 500):
+        result = await db.execute(
+            select(TransactionHistory)
+            .where(TransactionHistory.tx_hash.in_(hashes[start:start + 500]))
+            .with_for_update()
+        )
+        before.update((tx.tx_hash, stats_fields(tx)) for tx in result.scalars().all())
+    existing = set(before)
+
+    now = datetime.utcnow()
+    params = [
+        {
+            "b_tx_hash": update["tx_hash"],
+            "b_status": update["status"],
+            "b_confirmed_at": utc_naive(update.get("confirmed_at")) or (now if update["status"] == "completed" else None),
+            "b_gas_used": update.get("gas_used"),
+            "b_fees_paid": update.get("fees_paid"),
+        }
+        for update in updates
+        if update["tx_hash"] in existing
+    ]
+    if params:
+        table = TransactionHistory.__table__
+        statement = (
+            table.update()
+            .where(table.c.tx_hash == bindparam("b_tx_hash"))
+            .values(
+                status=bindparam("b_status"),
+                confirmed_at=func.coalesce(bindparam("b_confirmed_at"), table.c.confirmed_at),
+                gas_used=func.coalesce(bindparam("b_gas_used"), table.c.gas_used),
+                fees_paid=func.coalesce(bindparam("b_fees_paid"), table.c.fees_paid),
+            )
+        )
+        await db.execute(statement, params)
+
+        # Replay the updates in memory (same COALESCE rules) to update the aggregates
+        after = {tx_hash: dict(fields) for tx_hash, fields in before.items()}
+        for param in params:
+            fields = after[param["b_tx_hash"]]
+            fields["status"] = param["b_status"]
+            for column in ("confirmed_at", "gas_used", "fees_paid"):
+                if param[f"b_{column}"] is not None:
+                    fields[column] = param[f"b_{column}"]
+        await apply_stats_changes(db, [(before[tx_hash], after[tx_hash]) for tx_hash in after])
+    await db.commit()
+
+    return {tx_hash: ("updated" if tx_hash in existing else "not_found") for tx_hash in hashes}
+
+
+# --- Analytics aggregates ---
+
+# TransactionStats.user_address of the rows holding totals across all wallets
+ALL_WALLETS = "*"
+
+STATS_COUNTERS = (
+    "tx_count", "pending_count", "completed_count", "failed_count", "volume",
+    "fees_total", "fees_count", "confirmation_seconds_total", "confirmation_count",
+)
+
+def stats_fields(transaction) -> dict:
+    """Snapshot of the columns the aggregates depend on (from a TransactionHistory or a row)"""
+    return {
+        "user_address": transaction.user_address,
+        "from_chain_id": transaction.from_chain_id,
+        "to_chain_id": transaction.to_chain_id,
+        "status": transaction.status or "pending",
+        "from_amount": transaction.from_amount,
+        "gas_used": transaction.gas_used,
+        "fees_paid": transaction.fees_paid,
+        "created_at": transaction.created_at,
+        "confirmed_at": transaction.confirmed_at,
+    }
+
+def stats_contribution(fields: Optional[dict]) -> dict:
+    """What one transaction adds to each aggregate counter"""
+    if fields is None:
+        return dict.fromkeys(STATS_COUNTERS, 0)
+    try:
+        volume = float(fields["from_amount"] or 0)
+    except ValueError:
+        volume = 0.0
+    confirmed = (
+        fields["status"] == "completed" and fields["confirmed_at"] is not None and fields["created_at"] is not None
+    )
+    return {
+        "tx_count": 1,
+        "pending_count": int(fields["status"] == "pending"),
+        "completed_count": int(fields["status"] == "completed"),
+        "failed_count": int(fields["status"] == "failed"),
+        "volume": volume,
+        "fees_total": fields["fees_paid"] or 0.0,
+        "fees_count": int(fields["fees_paid"] is not None),
+        "confirmation_seconds_total": (
+            (fields["confirmed_at"] - fields["created_at"]).total_seconds() if confirmed else 0.0
+        ),
+        "confirmation_count": int(confirmed),
+    }
+
+def merge_stats_deltas(deltas: dict[tuple, dict], changes: list[tuple[Optional[dict], dict]]) -> dict[tuple, dict]:
+    """Add the counter deltas of (before, after) snapshots to deltas, keyed by aggregate row"""
+    for before, after in changes:
+        old, new = stats_contribution(before), stats_contribution(after)
+        pair = (after["from_chain_id"], after["to_chain_id"])
+        for address in (after["user_address"] or "", ALL_WALLETS):
+            delta = deltas.setdefault((address, *pair), dict.fromkeys(STATS_COUNTERS, 0))
+            for counter in STATS_COUNTERS:
+                delta[counter] += new[counter] - old[counter]
+    return deltas
+
+async def apply_stats_changes(db: AsyncSession, changes: list[tuple[Optional[dict], dict]]) -> None:
+    """
+    Fold (before, after) snapshots of written transactions into the wallet
+    and global aggregate rows, in the caller's transaction. Deltas are merged
+    per row first, so a batch costs one UPDATE per touched chain pair.
+    """
+    deltas = merge_stats_deltas({}, changes)
+    table = TransactionStats.__table__
+    for (address, from_chain_id, to_chain_id), delta in deltas.items():
+        if not any(delta.values()):
+            continue
+        key = (
+            (table.c.user_address == address)
+            & (table.c.from_chain_id == from_chain_id)
+            & (table.c.to_chain_id == to_chain_id)
+        )
+        result = await db.execute(
+            table.update().where(key).values({counter: table.c[counter] + delta[counter] for counter in STATS_COUNTERS})
+        )
+        if result.rowcount == 0:
+            await db.execute(table.insert().values(
+                user_address=address, from_chain_id=from_chain_id, to_chain_id=to_chain_id, **delta
+            ))
+
+async def get_transaction_stats(db: AsyncSession, user_address: str = ALL_WALLETS) -> list[TransactionStats]:
+    """Aggregate rows for a wallet (or ALL_WALLETS), one per chain pair"""
+    result = await db.execute(select(TransactionStats).where(TransactionStats.user_address == user_address))
+    return list(result.scalars().all())
+
+async def begin_write(db: AsyncSession) -> None:
+    """
+    On SQLite, make the caller's transaction a writer before it reads the
+    rows it is about to change (BEGIN IMMEDIATE), so aggregate deltas are
+    computed from a snapshot no other worker can change in between. Other
+    databases lock just those rows with SELECT ... FOR UPDATE instead.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    connection = await (await db.connection()).get_raw_connection()
+    # A transaction that already wrote something holds the write lock
+    if not connection.driver_connection.in_transaction:
+        await db.execute(text("BEGIN IMMEDIATE"))
+
+async def lock_table(db: AsyncSession, table) -> None:
+    """
+    Take the write lock for table at the start of the caller's transaction,
+    so a check-then-write can't interleave with another worker. SQLite has
+    no table locks and locks the whole database.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        await begin_write(db)
+    elif dialect == "postgresql":
+        await db.execute(text(f"LOCK TABLE {table.name} IN SHARE ROW EXCLUSIVE MODE"))
+
+async def backfill_transaction_stats(db: AsyncSession) -> int:
+    """
+    Build the aggregates from existing history if they are empty (first start
+    after upgrading). Every worker calls this at startup, so the check and
+    the build run under the write lock: one worker builds, writes elsewhere
+    wait for it, and the rest find the rows already there. Returns the
+    number of transactions folded in.
+    """
+    try:
+        await lock_table(db, TransactionStats.__table__)
+    except OperationalError as err:
+        # Still locked after the busy timeout: another worker is building
+        await db.rollback()
+        print(f"⚠️ Skipping analytics backfill, the database is busy: {err}")
+        return 0
+    if (await db.execute(select(TransactionStats.id).limit(1))).first() is not None:
+        await db.rollback()
+        return 0
+
+    columns = [TransactionHistory.__table__.c[field] for field in (
+        "user_address", "from_chain_id", "to_chain_id", "status", "from_amount",
+        "gas_used", "fees_paid", "created_at", "confirmed_at",
+    )]
+    deltas: dict[tuple, dict] = {}
+    count = 0
+    result = await db.stream(select(*columns).execution_options(yield_per=1000))
+    async for partition in result.partitions():
+        merge_stats_deltas(deltas, [(None, stats_fields(row)) for row in partition])
+        count += len(partition)
+
+    rows = [
+        {"user_address": address, "from_chain_id": from_chain_id, "to_chain_id": to_chain_id, **delta}
+        for (address, from_chain_id, to_chain_id), delta in deltas.items()
+        if any(delta.values())
+    ]
+    if rows:
+        await db.execute(TransactionStats.__table__.insert(), rows)
+    await db.commit()
+    return count
+
+
+# --- Write-behind batching ---
+
+class BatchedTransactionWriter:
+    """
+    Group commit for transaction writes. Inserts and status updates are
+    queued and applied in order in one transaction per batch, so many
+    concurrent submissions share a single commit (and fsync).
+
+    Callers still await their own result, so a request only returns once
+    its row is committed. A batch is flushed as soon as it holds
+    `max_batch` writes or `max_delay` seconds after its first write.
+    """
+    def __init__(self, session_factory: async_sessionmaker, max_batch: int = 100, max_delay: float = 0.01):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.writes = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush queued writes and stop the worker"""
+        if self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    async def create_transaction(self, **fields) -> TransactionHistory:
+        return await self._submit(("insert", fields))
+
+    async def update_transaction_status(self, tx_hash: str, status: str) -> Optional[TransactionHistory]:
+        return await self._submit(("status", (tx_hash, status)))
+
+    async def _submit(self, op: tuple):
+        if self._worker is None:
+            raise RuntimeError("BatchedTransactionWriter is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list) -> None:
+        results = []
+        # Stats snapshot of each written transaction before this batch (None if new)
+        snapshots = {}
+        try:
+            async with self.session_factory() as db:
+                await begin_write(db)
+                for (kind, payload), _ in batch:
+                    if kind == "insert":
+                        transaction = TransactionHistory(**payload)
+                        db.add(transaction)
+                        snapshots[transaction] = None
+                        results.append(transaction)
+                    else:
+                        tx_hash, status = payload
+                        # Rows inserted earlier in this batch must be visible
+                        await db.flush()
+                        transaction = await get_transaction_by_hash(db, tx_hash, for_update=True)
+                        if transaction is not None:
+                            snapshots.setdefault(transaction, stats_fields(transaction))
+                            transaction.status = status
+                            if status == "completed":
+                                transaction.confirmed_at = datetime.utcnow()
+                        results.append(transaction)
+                await db.flush()
+                await apply_stats_changes(db, [(before, stats_fields(tx)) for tx, before in snapshots.items()])
+                await db.commit()
+        except Exception as err:
+            if len(batch) > 1:
+                # Retry one by one so a single bad write only fails its own caller
+                for item in batch:
+                    await self._flush([item])
+                return
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(err)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch_size": round(self.writes / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
@@ -53,6 +53,18 @@ class TestQuoteParsing:
         assert result["fees_usd"] == 0
         assert result["gas_cost_usd"] == 0
 
+    def test_sse_event_format(self):
+        """Test Server-Sent Events framing used by streaming endpoints"""
+        import json
+        from main import sse_event
+
+        message = sse_event("quote", {"index": 0, "score": 1.5})
+        lines = message.split("\n")
+
+        assert lines[0] == "event: quote"
+        assert json.loads(lines[1][len("data: "):]) == {"index": 0, "score": 1.5}
+        assert message.endswith("\n\n")
+
     def test_calculate_route_score(self):
         """Test route scoring"""
         from main import QuoteSummary
@@ -141,6 +153,1381 @@ class TestRateLimiting:
         assert limiter.is_allowed(identifier) is True
         assert limiter.is_allowed(identifier) is False
 
+    def test_rate_limiter_sliding_window(self, monkeypatch):
+        """Test that the previous window's count decays as the window slides"""
+        import validation
+        from validation import RateLimiter
+
+        clock = [600.0]
+        monkeypatch.setattr(validation.time, "monotonic", lambda: clock[0])
+        limiter = RateLimiter(max_requests=4, window_seconds=60)
+
+        for _ in range(4):
+            assert limiter.is_allowed("user") is True
+        assert limiter.is_allowed("user") is False
+
+        clock[0] = 660.0 + 15  # 25% into the next window: 3 of 4 still count
+        assert limiter.is_allowed("user") is True
+        assert limiter.is_allowed("user") is False
+
+        clock[0] = 720.0 + 59  # end of the following window: old counts have decayed
+        assert limiter.is_allowed("user") is True
+
+    def test_rate_limiter_bounds_tracked_identifiers(self, monkeypatch):
+        """Test max_keys eviction and bulk expiry of idle identifiers"""
+        import validation
+        from validation import RateLimiter
+
+        clock = [0.0]
+        monkeypatch.setattr(validation.time, "monotonic", lambda: clock[0])
+        limiter = RateLimiter(max_requests=1, window_seconds=60, max_keys=3)
+
+        for i in range(5):
+            limiter.is_allowed(f"user_{i}")
+        assert len(limiter) == 3
+        assert "user_0" not in limiter.requests
+
+        clock[0] = 121.0
+        limiter.is_allowed("fresh")
+        assert list(limiter.requests) == ["fresh"]
+
+    def test_shared_rate_limiter_enforces_total_across_workers(self, tmp_path):
+        """Test that two workers on the same store share one limit"""
+        from validation import SharedRateLimiter
+
+        path = str(tmp_path / "limits.db")
+        worker_a = SharedRateLimiter(max_requests=10, window_seconds=60, path=path, name="quote", lease_size=1)
+        worker_b = SharedRateLimiter(max_requests=10, window_seconds=60, path=path, name="quote", lease_size=1)
+
+        allowed = [worker.is_allowed("user") for _ in range(10) for worker in (worker_a, worker_b)]
+
+        assert allowed.count(True) == 10
+
+    def test_shared_rate_limiter_leases_tokens_locally(self, tmp_path):
+        """Test that leased tokens are spent without a database round-trip"""
+        from validation import SharedRateLimiter
+
+        limiter = SharedRateLimiter(
+            max_requests=50, window_seconds=60, path=str(tmp_path / "limits.db"), lease_size=10
+        )
+
+        assert all(limiter.is_allowed("user") for _ in range(50))
+        assert limiter.is_allowed("user") is False
+        assert limiter.db_round_trips == 6
+
+    def test_shared_rate_limiter_waits_for_locks_off_the_event_loop(self, tmp_path):
+        """Test that another worker's write lock doesn't stall other requests"""
+        import asyncio
+        import sqlite3
+        from validation import SharedRateLimiter
+
+        path = str(tmp_path / "limits.db")
+        limiter = SharedRateLimiter(max_requests=10, window_seconds=60, path=path, lease_size=5)
+        other_worker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        other_worker.execute("BEGIN IMMEDIATE")
+
+        async def run():
+            ticks = 0
+            check = asyncio.create_task(limiter.acquire("user"))
+            asyncio.get_running_loop().call_later(0.2, other_worker.execute, "COMMIT")
+            while not check.done():
+                await asyncio.sleep(0.01)
+                ticks += 1
+            allowed = [await check] + [await limiter.acquire("user") for _ in range(10)]
+            return ticks, allowed
+
+        ticks, allowed = asyncio.run(run())
+
+        assert ticks >= 10
+        assert allowed.count(True) == 10
+        assert limiter.db_round_trips == 3
+
+
+class TestSingleFlight:
+    """Test request coalescing for concurrent quote misses"""
+
+    def test_concurrent_calls_share_one_fetch(self):
+        """Test that concurrent calls for the same key hit upstream once"""
+        import asyncio
+        from cache import SingleFlight
+
+        flights = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"estimate": {}}
+
+        async def run():
+            return await asyncio.gather(*[flights.do("key", fetch) for _ in range(5)])
+
+        results = asyncio.run(run())
+
+        assert len(calls) == 1
+        assert all(r == {"estimate": {}} for r in results)
+        assert flights.coalesced == 4
+        assert len(flights) == 0
+
+    def test_errors_propagate_to_every_waiter(self):
+        """Test that an upstream failure is raised for all coalesced callers"""
+        import asyncio
+        from cache import SingleFlight
+
+        flights = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        async def run():
+            return await asyncio.gather(
+                *[flights.do("key", fetch) for _ in range(3)], return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert len(flights) == 0
+
+
+class TestSummaryCache:
+    """Test AI summary caching keyed on parsed quotes"""
+
+    def test_near_identical_quotes_reuse_summary(self):
+        """Test that quotes within the same buckets share one LLM call"""
+        import asyncio
+        from cache import SummaryCache
+
+        cache = SummaryCache(fees_bucket=0.05, output_bucket=0.5, time_bucket=5)
+        calls = []
+
+        async def generate():
+            calls.append(1)
+            return "Swap via Stargate"
+
+        a = {"provider": "Stargate", "fees_usd": 1.01, "output_usd": 99.9, "time_seconds": 60}
+        b = {"provider": "Stargate", "fees_usd": 1.02, "output_usd": 100.1, "time_seconds": 61}
+
+        async def run():
+            return [await cache.get_or_create(a, generate), await cache.get_or_create(b, generate)]
+
+        assert asyncio.run(run()) == ["Swap via Stargate", "Swap via Stargate"]
+        assert len(calls) == 1
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_different_provider_misses(self):
+        """Test that a different provider never reuses a summary"""
+        from cache import SummaryCache
+
+        cache = SummaryCache()
+        a = {"provider": "Stargate", "fees_usd": 1.0, "output_usd": 100.0, "time_seconds": 60}
+        b = dict(a, provider="Hop")
+
+        assert cache.key(a) != cache.key(b)
+
+
+class TestConcurrencyLimiter:
+    """Test the LLM concurrency limiter"""
+
+    def test_limits_concurrency_and_tracks_queue(self):
+        """Test that no more than max_concurrency calls run at once"""
+        import asyncio
+        from concurrency import ConcurrencyLimiter
+
+        limiter = ConcurrencyLimiter(max_concurrency=2)
+        peak = []
+
+        async def work():
+            async with limiter:
+                peak.append(limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*[work() for _ in range(6)])
+
+        asyncio.run(run())
+        stats = limiter.stats()
+
+        assert max(peak) == 2
+        assert stats["calls"] == 6
+        assert stats["in_flight"] == 0
+        assert stats["queue_depth"] == 0
+        assert stats["max_queue_depth"] >= 4
+        assert stats["max_wait_ms"] > 0
+
+
+class TestGatherWithDeadline:
+    """Test concurrent route fetching with a shared deadline"""
+
+    def test_results_in_order_with_timeouts_and_errors(self):
+        """Test that slow routes time out while fast ones still return"""
+        import asyncio
+        from concurrency import gather_with_deadline
+
+        async def ok(value, delay):
+            await asyncio.sleep(delay)
+            return value
+
+        async def fail():
+            raise ValueError("bad route")
+
+        async def run():
+            return await gather_with_deadline([ok("a", 0), ok("b", 5), fail(), ok("c", 0.01)], timeout=0.2)
+
+        results = asyncio.run(run())
+
+        assert results[0] == "a"
+        assert isinstance(results[1], asyncio.TimeoutError)
+        assert isinstance(results[2], ValueError)
+        assert results[3] == "c"
+
+    def test_runs_concurrently(self):
+        """Test that total time is bounded by the slowest route, not the sum"""
+        import asyncio
+        import time
+        from concurrency import gather_with_deadline
+
+        async def run():
+            return await gather_with_deadline([asyncio.sleep(0.1, result=i) for i in range(10)], timeout=5)
+
+        start = time.monotonic()
+        assert asyncio.run(run()) == list(range(10))
+        assert time.monotonic() - start < 0.5
+
+
+class TestSummaryStreaming:
+    """Test token streaming of AI summaries"""
+
+    def test_stream_summary_caches_full_text(self, monkeypatch):
+        """Test that streamed tokens are joined into the summary cache"""
+        import asyncio
+        import main
+        from cache import SummaryCache
+        from langchain_core.messages import AIMessageChunk
+        from langchain_core.runnables import RunnableGenerator
+
+        async def fake_llm(inputs):
+            async for _ in inputs:
+                for token in ["Bridge ", "via ", "Hop."]:
+                    yield AIMessageChunk(content=token)
+
+        monkeypatch.setattr(main, "chain", RunnableGenerator(fake_llm))
+        monkeypatch.setattr(main, "summary_cache", SummaryCache())
+        quote = {"provider": "Hop", "fees_usd": 1.0, "output_usd": 99.0, "time_seconds": 30}
+
+        async def collect():
+            return [token async for token in main.stream_summary(quote)]
+
+        assert asyncio.run(collect()) == ["Bridge ", "via ", "Hop."]
+        assert asyncio.run(collect()) == ["Bridge via Hop."]
+        assert main.summary_cache.hits == 1
+
+    def test_compare_stream_event_order_and_deadline(self, monkeypatch):
+        """Test that quotes precede summaries, a slow route times out and done comes last"""
+        import asyncio
+        import json
+        from fastapi.testclient import TestClient
+        import main
+
+        # fromAmount -> (output USD, seconds until LI.FI answers)
+        upstream = {"100": ("99", 0.0), "200": ("95", 0.05), "300": ("99.9", 5.0)}
+
+        class FakeQuoteService:
+            async def get(self, req):
+                output_usd, delay = upstream[req.fromAmount]
+                await asyncio.sleep(delay)
+                summary = parse_quote({"estimate": {"toAmountUSD": output_usd, "fromAmountUSD": "100"}})
+                return {"summary": summary, "stale": False}
+
+        async def fake_summary(clean_summary):
+            await asyncio.sleep(0.01)
+            return f"Get {clean_summary['output_usd']} USD"
+
+        monkeypatch.setattr(main, "quote_service", FakeQuoteService())
+        monkeypatch.setattr(main, "summarize_quote", fake_summary)
+        monkeypatch.setattr(main, "COMPARE_DEADLINE_SECONDS", 0.5)
+        routes = [
+            {"fromChain": "1", "toChain": "137", "fromToken": "USDC", "toToken": "USDC", "fromAmount": amount}
+            for amount in upstream
+        ]
+
+        resp = TestClient(main.app).post("/api/v1/compare/stream", json=routes)
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in resp.text.strip().split("\n\n")
+        ]
+        names = [name for name, _ in events]
+
+        def position(name, index):
+            return next(i for i, (event, data) in enumerate(events) if event == name and data["index"] == index)
+
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        for index in (0, 1):
+            assert position("quote", index) < position("summary", index)
+        assert events[position("error", 2)][1]["timed_out"] is True
+        assert "quote" not in [name for name, data in events if data.get("index") == 2]
+        assert names.count("done") == 1 and names[-1] == "done"
+        done = events[-1][1]
+        assert done["best_route"]["index"] == 0
+        assert done["timed_out_count"] == 1
+
+
+class TestCacheBackends:
+    """Test pluggable quote cache backends"""
+
+    def test_sqlite_backend_shared_between_instances(self, tmp_path):
+        """Test that two backends on the same file (two workers) share entries"""
+        from cache import SQLiteCacheBackend
+
+        path = str(tmp_path / "quotes.db")
+        worker_a = SQLiteCacheBackend(path=path, maxsize=10, ttl=60)
+        worker_b = SQLiteCacheBackend(path=path, maxsize=10, ttl=60)
+
+        worker_a.set(("1", "137", "USDC", "USDC", "100"), {"estimate": {"toAmountUSD": "99"}})
+
+        assert worker_b.get(("1", "137", "USDC", "USDC", "100")) == {"estimate": {"toAmountUSD": "99"}}
+        assert len(worker_b) == 1
+
+    def test_sqlite_backend_ttl_and_size_eviction(self, tmp_path):
+        """Test that expired entries vanish and the store stays within maxsize"""
+        import time
+        from cache import SQLiteCacheBackend
+
+        cache = SQLiteCacheBackend(path=str(tmp_path / "quotes.db"), maxsize=3, ttl=60)
+        for i in range(5):
+            cache.set(("key", str(i)), {"i": i})
+
+        assert len(cache) == 3
+        assert cache.get(("key", "0")) is None
+        assert cache.get(("key", "4")) == {"i": 4}
+
+        short = SQLiteCacheBackend(path=str(tmp_path / "short.db"), maxsize=3, ttl=0.05)
+        short.set(("key",), {"i": 0})
+        time.sleep(0.1)
+        assert short.get(("key",)) is None
+
+    def test_incomplete_backend_fails_on_creation(self):
+        """Test that a backend missing part of the interface can't be built"""
+        from cache import CacheBackend
+
+        class NoDelete(CacheBackend):
+            def get(self, key):
+                return None
+
+            def set(self, key, value):
+                pass
+
+            def __len__(self):
+                return 0
+
+        with pytest.raises(TypeError):
+            NoDelete()
+
+    def test_tiered_cache_promotes_l2_hits(self, tmp_path):
+        """Test that an L2 hit is copied into L1"""
+        from cache import MemoryCacheBackend, SQLiteCacheBackend, TieredCache
+
+        l2 = SQLiteCacheBackend(path=str(tmp_path / "quotes.db"))
+        l2.set(("k",), {"v": 1})
+        cache = TieredCache(MemoryCacheBackend(maxsize=10, ttl=5), l2)
+
+        assert cache.get(("k",)) == {"v": 1}
+        assert cache.get(("k",)) == {"v": 1}
+        assert cache.l2_hits == 1
+        assert cache.l1_hits == 1
+
+    def test_shared_cache_waits_for_locks_off_the_event_loop(self, tmp_path):
+        """Test that another worker's write lock doesn't stall other requests"""
+        import asyncio
+        import sqlite3
+        from cache import MemoryCacheBackend, SQLiteCacheBackend, TieredCache
+
+        path = str(tmp_path / "quotes.db")
+        cache = TieredCache(MemoryCacheBackend(maxsize=10, ttl=5), SQLiteCacheBackend(path=path))
+        other_worker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        other_worker.execute("BEGIN IMMEDIATE")
+
+        async def run():
+            ticks = 0
+            write = asyncio.create_task(cache.aset(("k",), {"v": 1}))
+            asyncio.get_running_loop().call_later(0.2, other_worker.execute, "COMMIT")
+            while not write.done():
+                await asyncio.sleep(0.01)
+                ticks += 1
+            await write
+            return ticks, await cache.l2.aget(("k",)), await cache.alen()
+
+        ticks, value, size = asyncio.run(run())
+
+        assert ticks >= 10
+        assert value == {"v": 1}
+        assert size == 1
+
+
+class TestHotKeyTracker:
+    """Test hot quote tracking for refresh-ahead"""
+
+    def test_top_returns_most_hit_keys_first(self):
+        """Test that keys are ranked by hit count with their payloads"""
+        from cache import HotKeyTracker
+
+        tracker = HotKeyTracker(maxsize=10, window=60)
+        for key, hits in [("eth-usdc", 5), ("dai-usdc", 1), ("wbtc-eth", 3)]:
+            for _ in range(hits):
+                tracker.touch(key, payload=f"req:{key}")
+
+        assert tracker.top(2) == [("eth-usdc", "req:eth-usdc"), ("wbtc-eth", "req:wbtc-eth")]
+        assert len(tracker) == 3
+
+
+class TestQuoteKeyNormalizer:
+    """Test cache key normalization"""
+
+    def test_canonicalizes_chains_and_tokens(self):
+        """Test that chain aliases and token case map to one key"""
+        from cache import QuoteKeyNormalizer
+
+        keys = QuoteKeyNormalizer(chain_aliases={"1": "1", "ethereum": "1", "eth": "1", "137": "137", "pol": "137"})
+        address = "0xd8dA6BF26964aF9D7eEd9e03E53415D37aA96045"
+
+        assert keys.key("eth", "pol", "usdc", "Usdc", "1000", address) == \
+            keys.key("Ethereum", "137", "USDC", "USDC", "1000", address)
+        assert keys.token("0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48") == "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+
+    def test_amount_buckets_and_address_dropping(self):
+        """Test relative amount buckets and optional fromAddress removal"""
+        from cache import QuoteKeyNormalizer
+
+        exact = QuoteKeyNormalizer()
+        bucketed = QuoteKeyNormalizer(amount_precision=0.01, drop_address=True)
+
+        assert exact.key("1", "137", "USDC", "USDC", "1000000", "0xa") != exact.key("1", "137", "USDC", "USDC", "1000100", "0xa")
+        assert bucketed.key("1", "137", "USDC", "USDC", "1000000", "0xa") == bucketed.key("1", "137", "USDC", "USDC", "1000100", "0xb")
+        assert bucketed.key("1", "137", "USDC", "USDC", "1000000", "0xa") != bucketed.key("1", "137", "USDC", "USDC", "1100000", "0xa")
+
+    def test_reports_hits_gained_from_normalization(self):
+        """Test that only hits the exact key would have missed are credited"""
+        from cache import QuoteKeyNormalizer
+
+        keys = QuoteKeyNormalizer(amount_precision=0.01)
+        keys.record(("1", "137", "USDC", "USDC", "1000000"), hit=False)
+        keys.record(("1", "137", "USDC", "USDC", "1000000"), hit=True)
+        keys.record(("1", "137", "USDC", "USDC", "1000100"), hit=True)
+
+        assert keys.normalized_hits == 1
+        assert keys.stats()["hit_rate_gain"] == "33.3%"
+
+
+class TestQuoteService:
+    """Test the shared LI.FI quote fetching service"""
+
+    def make_service(self, handler, extractors=None):
+        import httpx
+        from cache import MemoryCacheBackend, QuoteKeyNormalizer
+        from quotes import QuoteService
+        from validation import RateLimiter
+
+        service = QuoteService(
+            cache=MemoryCacheBackend(maxsize=10, ttl=60),
+            keys=QuoteKeyNormalizer(),
+            limiter=RateLimiter(max_requests=100, window_seconds=60),
+            extractors=extractors,
+        )
+        service.client = httpx.AsyncClient(base_url="https://li.quest", transport=httpx.MockTransport(handler))
+        return service
+
+    def test_repeat_lookups_hit_cache(self):
+        """Test that a second lookup (e.g. the detailed view) costs nothing upstream"""
+        import asyncio
+        import httpx
+        from main import QuoteRequest
+        from quotes import quote_data
+
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={"estimate": {"toAmountUSD": "99"}})
+
+        service = self.make_service(handler, extractors={"quote": parse_quote})
+        req = QuoteRequest(fromChain="1", toChain="137", fromToken="USDC", toToken="USDC", fromAmount="100")
+
+        async def run():
+            return [await service.get(req), await service.get(req)]
+
+        first, second = asyncio.run(run())
+
+        assert len(calls) == 1
+        assert first["summary"]["output_usd"] == second["summary"]["output_usd"] == 99.0
+        # Only the raw text is kept; the full tree is decoded on demand
+        assert "data" not in second
+        assert quote_data(second) == {"estimate": {"toAmountUSD": "99"}}
+        assert service.cache_hits == 1
+        assert service.cache_misses == 1
+
+    def test_stale_entries_are_served_while_one_refresh_runs(self):
+        """Test stale-while-revalidate: a stale hit is served and refreshed once in the background"""
+        import asyncio
+        import httpx
+        from main import QuoteRequest
+
+        calls = []
+        release = asyncio.Event()
+
+        async def handler(request):
+            calls.append(request)
+            if len(calls) > 1:
+                await release.wait()
+            return httpx.Response(200, json={"estimate": {"toAmountUSD": str(90 + len(calls))}})
+
+        service = self.make_service(handler, extractors={"quote": parse_quote})
+        req = QuoteRequest(fromChain="1", toChain="137", fromToken="USDC", toToken="USDC", fromAmount="100")
+
+        async def run():
+            await service.get(req)
+            # Age the entry past soft_ttl
+            service.cache.get(service.cache_key(req))["fetched_at"] -= service.soft_ttl + 1
+
+            stale = await service.get(req)
+            await asyncio.sleep(0)  # let the refresh start
+            still_stale = await service.get(req)
+            release.set()
+            await asyncio.gather(*service.background_tasks)
+            return stale, still_stale, await service.get(req)
+
+        stale, still_stale, fresh = asyncio.run(run())
+
+        assert stale["stale"] is True and still_stale["stale"] is True
+        assert stale["summary"]["output_usd"] == 91.0
+        assert len(calls) == 2
+        assert service.background_refreshes == 1
+        assert service.stale_served == 2
+        assert fresh["stale"] is False
+        assert fresh["summary"]["output_usd"] == 92.0
+
+    def test_hot_refresh_survives_bad_entries_and_failed_passes(self):
+        """Test that legacy cache entries are refreshed and a failing pass doesn't end the loop"""
+        import asyncio
+        import httpx
+        from main import QuoteRequest
+
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={"estimate": {"toAmountUSD": "99"}})
+
+        service = self.make_service(handler, extractors={"quote": parse_quote})
+        service.refresh_interval = 0.01
+        req = QuoteRequest(fromChain="1", toChain="137", fromToken="USDC", toToken="USDC", fromAmount="100")
+        cache_key = service.cache_key(req)
+        service.hot.touch(cache_key, req)
+        service.cache.set(cache_key, {"data": {}})  # layout of an older version
+        lookups = []
+        aget = service.cache.aget
+
+        async def flaky_aget(key):
+            lookups.append(key)
+            if len(lookups) == 1:
+                raise OSError("cache unavailable")
+            return await aget(key)
+
+        service.cache.aget = flaky_aget
+
+        async def run():
+            loop = asyncio.create_task(service.refresh_hot_quotes())
+            for _ in range(100):
+                if calls:
+                    break
+                await asyncio.sleep(0.01)
+            loop.cancel()
+            await asyncio.gather(*service.background_tasks)
+
+        asyncio.run(run())
+
+        assert service.refresh_failures == 1
+        assert len(calls) == 1
+        assert "raw" in service.cache.get(cache_key)
+
+    def test_upstream_errors_map_to_http_errors(self):
+        """Test that LI.FI failures and invalid input surface as HTTPException"""
+        import asyncio
+        import httpx
+        import pytest
+        from fastapi import HTTPException
+        from main import QuoteRequest
+
+        service = self.make_service(lambda request: httpx.Response(404, text="No route"))
+        req = QuoteRequest(fromChain="1", toChain="137", fromToken="USDC", toToken="USDC", fromAmount="100")
+
+        with pytest.raises(HTTPException) as err:
+            asyncio.run(service.get(req))
+        assert err.value.status_code == 404
+
+        with pytest.raises(HTTPException) as err:
+            asyncio.run(service.get(req.model_copy(update={"fromAddress": "not_an_address"})))
+        assert err.value.status_code == 400
+
+    def test_routes_are_fetched_parsed_and_ranked(self):
+        """Test that alternative routes are requested once and parsed in bulk"""
+        import asyncio
+        import json
+        import httpx
+        from main import QuoteRequest, parse_routes
+        from ranking import rank_routes
+
+        def route(route_id, output_usd, gas_usd, seconds):
+            return {
+                "id": route_id, "fromAmountUSD": "100", "toAmountUSD": str(output_usd), "gasCostUSD": str(gas_usd),
+                "tags": [],
+                "steps": [{
+                    "tool": route_id, "toolDetails": {"name": route_id.title()},
+                    "action": {"fromChainId": 1, "toChainId": 137,
+                               "fromToken": {"symbol": "USDC"}, "toToken": {"symbol": "USDC"}},
+                    "estimate": {"executionDuration": seconds, "feeCosts": [{"amountUSD": "0.5"}]},
+                }],
+            }
+
+        bodies = []
+
+        def handler(request):
+            bodies.append(json.loads(request.content))
+            return httpx.Response(200, json={"routes": [route("hop", 98.0, 1.0, 300), route("across", 99.0, 0.5, 60)]})
+
+        service = self.make_service(handler, extractors={"routes": parse_routes})
+        req = QuoteRequest(fromChain="1", toChain="137", fromToken="USDC", toToken="USDC", fromAmount="100")
+
+        async def run():
+            return [await service.get_routes(req), await service.get_routes(req)]
+
+        first, second = asyncio.run(run())
+        routes = second["summary"]
+
+        assert len(bodies) == 1
+        assert bodies[0]["fromChainId"] == 1 and bodies[0]["toChainId"] == 137
+        assert routes[0]["provider"] == "Hop"
+        assert routes[0]["fees_usd"] == 1.5
+        assert routes[1]["steps"][0]["estimated_time"] == 60
+        assert rank_routes(routes)[0][0] == 1
+
+
+class TestRepositories:
+    """Test async database access"""
+
+    def test_transaction_lifecycle(self, tmp_path):
+        """Test creating, listing and updating transactions on an async engine"""
+        import asyncio
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from database import Base
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+            async with sessions() as db:
+                for i in range(3):
+                    await repositories.create_transaction(
+                        db, user_address="0xabc", from_chain_id=1, to_chain_id=137,
+                        from_token="USDC", to_token="USDC", from_amount="100",
+                        to_amount="99", tx_hash=f"0x{i}", status="pending"
+                    )
+                updated = await repositories.update_transaction_status(db, "0x1", "completed")
+                missing = await repositories.update_transaction_status(db, "0xmissing", "failed")
+                history = await repositories.list_transactions(db, "0xabc", limit=2)
+            await engine.dispose()
+            return updated, missing, history
+
+        updated, missing, history = asyncio.run(run())
+
+        assert updated.status == "completed"
+        assert updated.confirmed_at is not None
+        assert missing is None
+        assert len(history) == 2
+
+    def test_keyset_pagination_walks_all_pages(self, tmp_path):
+        """Test that cursors page through history without gaps or repeats"""
+        import asyncio
+        from datetime import datetime, timedelta
+        from sqlalchemy.exc import IntegrityError
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from database import Base
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+            start = datetime(2025, 1, 1)
+
+            async with sessions() as db:
+                for i in range(7):
+                    # Pairs of rows share a timestamp so the id tie-breaker matters
+                    await repositories.create_transaction(
+                        db, user_address="0xabc", tx_hash=f"0x{i}", created_at=start + timedelta(minutes=i // 2)
+                    )
+                pages, before = [], None
+                while True:
+                    page = await repositories.list_transactions(db, "0xabc", limit=3, before=before)
+                    if not page:
+                        break
+                    pages.append([tx.tx_hash for tx in page])
+                    before = repositories.decode_cursor(repositories.encode_cursor(page[-1]))
+
+            async with sessions() as db:
+                try:
+                    await repositories.create_transaction(db, user_address="0xabc", tx_hash="0x0")
+                    duplicate_rejected = False
+                except IntegrityError:
+                    duplicate_rejected = True
+            await engine.dispose()
+            return pages, duplicate_rejected
+
+        pages, duplicate_rejected = asyncio.run(run())
+
+        assert pages == [["0x6", "0x5", "0x4"], ["0x3", "0x2", "0x1"], ["0x0"]]
+        assert duplicate_rejected
+
+    def test_batched_writer_groups_commits(self, tmp_path):
+        """Test that concurrent writes share commits and keep their order"""
+        import asyncio
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from database import Base
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            writer = repositories.BatchedTransactionWriter(
+                async_sessionmaker(engine, expire_on_commit=False), max_batch=50, max_delay=0.05
+            )
+            writer.start()
+            inserts = [
+                writer.create_transaction(user_address="0xabc", tx_hash=f"0x{i}", status="pending")
+                for i in range(20)
+            ]
+            update = writer.update_transaction_status("0x3", "completed")
+            results = await asyncio.gather(*inserts, update)
+            await writer.stop()
+            await engine.dispose()
+            return writer, results
+
+        writer, results = asyncio.run(run())
+
+        assert writer.writes == 21
+        assert writer.batches < 5
+        assert all(tx.id is not None for tx in results[:20])
+        assert results[20].status == "completed"
+
+    def test_bulk_status_update(self, tmp_path):
+        """Test applying many status updates in one transaction"""
+        import asyncio
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from database import Base
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+            async with sessions() as db:
+                for i in range(3):
+                    await repositories.create_transaction(db, user_address="0xabc", tx_hash=f"0x{i}", gas_used=21000.0)
+                outcomes = await repositories.bulk_update_transaction_status(db, [
+                    {"tx_hash": "0x0", "status": "completed", "fees_paid": 1.5},
+                    {"tx_hash": "0x1", "status": "failed", "gas_used": 50000.0},
+                    {"tx_hash": "0xmissing", "status": "completed"},
+                ])
+            async with sessions() as db:
+                rows = {tx.tx_hash: tx for tx in await repositories.list_transactions(db, "0xabc")}
+            await engine.dispose()
+            return outcomes, rows
+
+        outcomes, rows = asyncio.run(run())
+
+        assert outcomes == {"0x0": "updated", "0x1": "updated", "0xmissing": "not_found"}
+        assert rows["0x0"].status == "completed"
+        assert rows["0x0"].confirmed_at is not None
+        assert rows["0x0"].fees_paid == 1.5
+        assert rows["0x0"].gas_used == 21000.0
+        assert rows["0x1"].status == "failed"
+        assert rows["0x1"].gas_used == 50000.0
+        assert rows["0x1"].confirmed_at is None
+        assert rows["0x2"].status == "pending"
+
+    def test_bulk_status_endpoint_accepts_utc_timestamps(self, tmp_path):
+        """Test that a "Z" confirmed_at is stored as naive UTC and feeds the aggregates"""
+        import asyncio
+        from datetime import datetime
+        from fastapi.testclient import TestClient
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from sqlalchemy.pool import NullPool
+        import main
+        import repositories
+        from database import Base, get_async_db
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def setup():
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with sessions() as db:
+                await repositories.create_transaction(
+                    db, user_address="0xabc", tx_hash="0x1", from_chain_id=1, to_chain_id=137,
+                    created_at=datetime(2026, 10, 18, 5, 0),
+                )
+
+        async def get_db():
+            async with sessions() as db:
+                yield db
+
+        async def read():
+            async with sessions() as db:
+                rows = await repositories.list_transactions(db, "0xabc")
+                stats = await repositories.get_transaction_stats(db, "0xabc")
+            return rows[0], stats[0]
+
+        asyncio.run(setup())
+        main.app.dependency_overrides[get_async_db] = get_db
+        try:
+            resp = TestClient(main.app).patch("/api/v1/transactions/status/bulk", json=[
+                {"tx_hash": "0x1", "status": "completed", "confirmed_at": "2026-10-18T06:00:00Z"},
+            ])
+        finally:
+            main.app.dependency_overrides.pop(get_async_db)
+        row, stats = asyncio.run(read())
+
+        assert resp.status_code == 200
+        assert resp.json()["updated"] == 1
+        assert row.confirmed_at == datetime(2026, 10, 18, 6, 0)
+        assert stats.confirmation_seconds_total == 3600.0
+
+    def test_status_update_converts_offsets_to_utc(self):
+        """Test that confirmed_at with a UTC offset is shifted, not truncated"""
+        from datetime import datetime
+        from main import TransactionStatusUpdate
+
+        update = TransactionStatusUpdate(tx_hash="0x1", status="completed", confirmed_at="2026-10-18T08:00:00+02:00")
+
+        assert update.confirmed_at == datetime(2026, 10, 18, 6, 0)
+        assert update.confirmed_at.tzinfo is None
+
+    def test_analytics_aggregates_follow_writes(self, tmp_path):
+        """Test that aggregates track inserts and status changes and match a rebuild"""
+        import asyncio
+        from sqlalchemy import delete
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from database import Base, TransactionStats
+
+        def counters(rows):
+            return {
+                (row.user_address, row.from_chain_id, row.to_chain_id):
+                    tuple(getattr(row, counter) for counter in repositories.STATS_COUNTERS)
+                for row in rows
+            }
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+            async with sessions() as db:
+                for i in range(3):
+                    await repositories.create_transaction(
+                        db, user_address="0xabc", tx_hash=f"0x{i}", from_chain_id=1, to_chain_id=137, from_amount="100"
+                    )
+                await repositories.create_transaction(
+                    db, user_address="0xdef", tx_hash="0x9", from_chain_id=1, to_chain_id=10, from_amount="50"
+                )
+                await repositories.update_transaction_status(db, "0x0", "completed")
+                await repositories.bulk_update_transaction_status(db, [
+                    {"tx_hash": "0x1", "status": "failed", "fees_paid": 2.0},
+                    {"tx_hash": "0x9", "status": "completed", "fees_paid": 1.0},
+                ])
+                wallet = await repositories.get_transaction_stats(db, "0xabc")
+                everyone = await repositories.get_transaction_stats(db)
+                live = counters(await repositories.get_transaction_stats(db)) | counters(wallet)
+
+                await db.execute(delete(TransactionStats))
+                await db.commit()
+                rebuilt_count = await repositories.backfill_transaction_stats(db)
+                rebuilt = counters(await repositories.get_transaction_stats(db)) | counters(
+                    await repositories.get_transaction_stats(db, "0xabc")
+                )
+            await engine.dispose()
+            return wallet, everyone, live, rebuilt, rebuilt_count
+
+        wallet, everyone, live, rebuilt, rebuilt_count = asyncio.run(run())
+
+        assert len(wallet) == 1
+        row = wallet[0]
+        assert (row.tx_count, row.pending_count, row.completed_count, row.failed_count) == (3, 1, 1, 1)
+        assert row.volume == 300.0
+        assert (row.fees_total, row.fees_count) == (2.0, 1)
+        assert row.confirmation_count == 1
+        assert sum(row.tx_count for row in everyone) == 4
+        assert rebuilt_count == 4
+        assert rebuilt == live
+
+    def test_concurrent_status_updates_apply_deltas_once(self, tmp_path):
+        """Test that overlapping updates of one pending transaction count its completion once"""
+        import asyncio
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from database import Base
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+            async with sessions() as db:
+                await repositories.create_transaction(db, user_address="0xabc", tx_hash="0x1", from_chain_id=1, to_chain_id=137)
+
+            async def bulk():
+                async with sessions() as db:
+                    await repositories.bulk_update_transaction_status(db, [{"tx_hash": "0x1", "status": "completed"}])
+
+            async def single():
+                async with sessions() as db:
+                    await repositories.update_transaction_status(db, "0x1", "completed")
+
+            writer = repositories.BatchedTransactionWriter(sessions, max_batch=10, max_delay=0.01)
+            writer.start()
+            await asyncio.gather(bulk(), bulk(), single(), bulk(), writer.update_transaction_status("0x1", "completed"))
+            await writer.stop()
+            async with sessions() as db:
+                totals = await repositories.get_transaction_stats(db)
+            await engine.dispose()
+            return totals
+
+        (row,) = asyncio.run(run())
+
+        assert (row.tx_count, row.pending_count, row.completed_count) == (1, 0, 1)
+        assert row.confirmation_count == 1
+
+    def test_concurrent_backfills_count_history_once(self, tmp_path):
+        """Test that workers backfilling at the same time don't double-count"""
+        import asyncio
+        from sqlalchemy import delete
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from database import Base, TransactionStats
+
+        async def run():
+            url = f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+            engines = [create_async_engine(url), create_async_engine(url)]
+            async with engines[0].begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            workers = [async_sessionmaker(engine, expire_on_commit=False) for engine in engines]
+
+            async with workers[0]() as db:
+                for i in range(5):
+                    await repositories.create_transaction(db, user_address="0xabc", tx_hash=f"0x{i}", from_chain_id=1, to_chain_id=137)
+                await db.execute(delete(TransactionStats))
+                await db.commit()
+
+            async def backfill(sessions):
+                async with sessions() as db:
+                    return await repositories.backfill_transaction_stats(db)
+
+            counts = await asyncio.gather(*(backfill(sessions) for sessions in workers))
+            async with workers[0]() as db:
+                totals = await repositories.get_transaction_stats(db)
+            for engine in engines:
+                await engine.dispose()
+            return counts, totals
+
+        counts, totals = asyncio.run(run())
+
+        assert sorted(counts) == [0, 5]
+        assert [row.tx_count for row in totals] == [5]
+
+    def test_async_url_conversion(self):
+        """Test that DATABASE_URL drivers are mapped to their async equivalents"""
+        from database import to_async_url, to_sync_url
+
+        assert to_async_url("sqlite:///./chaincompass.db") == "sqlite+aiosqlite:///./chaincompass.db"
+        assert to_async_url("postgresql://user:pw@db/app") == "postgresql+asyncpg://user:pw@db/app"
+        assert to_async_url("sqlite+pysqlite:////tmp/x.db") == "sqlite+aiosqlite:////tmp/x.db"
+        assert to_async_url("postgresql+psycopg2://user:pw@db/app") == "postgresql+asyncpg://user:pw@db/app"
+        assert to_async_url("postgresql+asyncpg://user:pw@db/app") == "postgresql+asyncpg://user:pw@db/app"
+        assert to_async_url("postgresql+psycopg://user:pw@db/app") == "postgresql+psycopg://user:pw@db/app"
+        assert to_async_url("mysql+pymysql://user:pw@db/app") == "mysql+aiomysql://user:pw@db/app"
+        assert to_sync_url("sqlite+aiosqlite:///./chaincompass.db") == "sqlite:///./chaincompass.db"
+
+
+class TestConfirmationPoller:
+    """Test resolving pending transactions from a fake JSON-RPC node"""
+
+    def test_poll_resolves_mined_transactions(self, tmp_path):
+        """Test that receipts are batched per chain and applied in bulk"""
+        import asyncio
+        import json
+        import httpx
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        import repositories
+        from confirmations import ConfirmationPoller, JsonRpcClient
+        from database import Base
+
+        receipts = {
+            "0xa": {"status": "0x1", "gasUsed": hex(21000), "effectiveGasPrice": hex(10**9)},
+            "0xb": {"status": "0x0", "gasUsed": hex(50000), "effectiveGasPrice": hex(10**9)},
+        }
+        posts = []
+
+        def fake_node(request: httpx.Request) -> httpx.Response:
+            calls = json.loads(request.content)
+            posts.append((request.url.host, len(calls)))
+            return httpx.Response(200, json=[
+                {"jsonrpc": "2.0", "id": call["id"], "result": receipts.get(call["params"][0])}
+                for call in calls
+            ])
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+            async with sessions() as db:
+                for tx_hash, chain_id in [("0xa", 1), ("0xb", 1), ("0xc", 137), ("0xd", 10)]:
+                    await repositories.create_transaction(db, user_address="0xabc", tx_hash=tx_hash, from_chain_id=chain_id)
+
+            poller = ConfirmationPoller(sessions, min_interval=1, max_interval=8)
+            client = httpx.AsyncClient(transport=httpx.MockTransport(fake_node))
+            poller.rpc = JsonRpcClient({1: "http://eth.local", 137: "http://polygon.local"}, client)
+            resolved = await poller.poll_once()
+            async with sessions() as db:
+                rows = {tx.tx_hash: tx for tx in await repositories.list_transactions(db, "0xabc")}
+            await client.aclose()
+            await engine.dispose()
+            return poller, resolved, rows
+
+        poller, resolved, rows = asyncio.run(run())
+
+        assert resolved == 2
+        assert sorted(posts) == [("eth.local", 2), ("polygon.local", 1)]
+        assert rows["0xa"].status == "completed"
+        assert rows["0xa"].fees_paid == pytest.approx(21000 * 1e9 / 1e18)
+        assert rows["0xb"].status == "failed"
+        assert rows["0xc"].status == "pending"  # not mined yet
+        assert rows["0xd"].status == "pending"  # no RPC configured for chain 10
+        assert poller.confirmed == 1 and poller.failed == 1
+
+    def test_interval_backs_off_until_activity(self):
+        """Test that idle polls back off and wake() resets the interval"""
+        from confirmations import ConfirmationPoller, parse_rpc_urls
+
+        poller = ConfirmationPoller(None, min_interval=1, max_interval=8, backoff=2)
+        assert [poller.next_interval(0) for _ in range(5)] == [2, 4, 8, 8, 8]
+        assert poller.next_interval(3) == 1
+        poller.next_interval(0)
+        poller.wake()
+        assert poller.interval == 1
+        assert parse_rpc_urls("1=http://a, 137=http://b") == {1: "http://a", 137: "http://b"}
+
+    def test_only_one_worker_holds_the_polling_lease(self, tmp_path):
+        """Test that pollers in different workers share one lease, which is taken over after release"""
+        import asyncio
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from confirmations import ConfirmationPoller
+        from database import Base
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+            workers = [ConfirmationPoller(sessions) for _ in range(3)]
+
+            first = await asyncio.gather(*(worker.acquire_lease() for worker in workers))
+            renewed = [await worker.acquire_lease() for worker in workers]
+            leader = workers[first.index(True)]
+            leader._task = asyncio.create_task(asyncio.sleep(60))
+            await leader.stop()
+            takeover = [await worker.acquire_lease() for worker in workers if worker is not leader]
+            await engine.dispose()
+            return first, renewed, takeover
+
+        first, renewed, takeover = asyncio.run(run())
+
+        assert first.count(True) == 1
+        assert renewed == first
+        assert takeover.count(True) == 1
+
+
+class TestRanking:
+    """Test vectorized route ranking"""
+
+    def test_balanced_profile_matches_scalar_weights(self):
+        """Test that the balanced profile keeps the original scoring formula"""
+        from ranking import metric_matrix, score_routes
+
+        routes = [
+            {"output_usd": 100.0, "fees_usd": 2.0, "time_seconds": 60, "price_impact": -0.5},
+            {"output_usd": 1.0, "fees_usd": 5.0},
+        ]
+        scores = score_routes(metric_matrix(routes))
+
+        assert scores[0] == pytest.approx(100 * 10 - 2 * 20 - 60 * 0.1 - 0.5 * 5)
+        assert scores[1] == 0  # floored
+
+    def test_profiles_and_pareto_front(self):
+        """Test that profiles reorder routes and dominated routes are flagged"""
+        from ranking import rank_routes
+
+        routes = [
+            {"output_usd": 99.0, "fees_usd": 1.0, "time_seconds": 600},  # cheap, slow
+            {"output_usd": 98.0, "fees_usd": 2.0, "time_seconds": 30},   # fast
+            {"output_usd": 97.0, "fees_usd": 3.0, "time_seconds": 600},  # dominated by route 0
+        ]
+
+        assert rank_routes(routes, "cheapest")[0][0] == 0
+        assert rank_routes(routes, "fastest")[0][0] == 1
+        assert {i: front for i, _, front in rank_routes(routes)} == {0: True, 1: True, 2: False}
+        assert sorted(i for i, _, _ in rank_routes(routes, pareto_only=True)) == [0, 1]
+        assert rank_routes([]) == []
+
+    def test_unknown_profile_rejected(self):
+        """Test that an unknown weight profile raises"""
+        from ranking import metric_matrix, score_routes
+
+        with pytest.raises(ValueError):
+            score_routes(metric_matrix([{"output_usd": 1.0}]), "cheapest_and_fastest")
+
+
+class TestCatalogRegistry:
+    """Test the chain/token catalog"""
+
+    CHAINS = {"chains": [
+        {"id": 1, "key": "eth", "name": "Ethereum", "coin": "ETH"},
+        {"id": 137, "key": "pol", "name": "Polygon", "coin": "POL"},
+    ]}
+    TOKENS = {"tokens": {
+        "1": [{"symbol": "USDC", "address": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48", "decimals": 6}],
+        "137": [{"symbol": "USDC", "address": "0x3c499c542cEF5E3811e1192ce70d8cC03d5c3359", "decimals": 6}],
+    }}
+
+    def test_refresh_builds_indexes_and_snapshot(self, tmp_path):
+        """Test that a refresh indexes LI.FI's catalog and a cold start reloads it offline"""
+        import asyncio
+        import httpx
+        from registry import CatalogRegistry
+
+        def handler(request):
+            return httpx.Response(200, json=self.CHAINS if request.url.path == "/v1/chains" else self.TOKENS)
+
+        path = str(tmp_path / "catalog.json")
+        registry = CatalogRegistry(snapshot_path=path, fallback_chains=[{"id": 1, "name": "Ethereum"}])
+        assert registry.chain_id("137") is None
+
+        async def refresh():
+            async with httpx.AsyncClient(base_url="https://li.quest", transport=httpx.MockTransport(handler)) as client:
+                await registry.refresh(client)
+
+        asyncio.run(refresh())
+        offline = CatalogRegistry(snapshot_path=path, extra_chain_ids=[11155111])
+
+        assert offline.source == "snapshot"
+        assert offline.chain_id("POL") == offline.chain_id("Polygon") == 137
+        assert offline.token_address(137, "usdc") == "0x3c499c542cEF5E3811e1192ce70d8cC03d5c3359"
+        assert offline.token(1, "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48")["symbol"] == "USDC"
+        assert 11155111 in offline.chain_ids and 1 in offline.chain_ids
+
+    def test_concurrent_snapshot_writes_use_separate_temp_files(self, tmp_path):
+        """Test that workers saving at once all succeed and leave one valid snapshot"""
+        import json
+        from concurrent.futures import ThreadPoolExecutor
+        from registry import CatalogRegistry
+
+        path = str(tmp_path / "catalog.json")
+        workers = [CatalogRegistry(snapshot_path=path, fallback_chains=self.CHAINS["chains"]) for _ in range(8)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda registry: [registry.save_snapshot() for _ in range(20)], workers))
+
+        assert [p.name for p in tmp_path.iterdir()] == ["catalog.json"]
+        assert len(json.loads(open(path).read())["chains"]) == len(self.CHAINS["chains"])
+
+    def test_quote_keys_canonicalize_through_catalog(self):
+        """Test that a symbol and its address produce the same cache key"""
+        from cache import QuoteKeyNormalizer
+        from registry import CatalogRegistry
+
+        registry = CatalogRegistry()
+        registry._index(self.CHAINS["chains"], self.TOKENS["tokens"])
+        keys = QuoteKeyNormalizer(catalog=registry)
+
+        by_symbol = keys.key("eth", "Polygon", "usdc", "USDC", "100", None)
+        by_address = keys.key("1", "137", "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48", "USDC", "100", None)
+
+        assert by_symbol == by_address
+        assert by_symbol[:3] == ("1", "137", "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48")
+
+
+class TestConditionalResponses:
+    """Test ETag / 304 handling and cache headers"""
+
+    def test_catalog_and_health_revalidate_with_304(self):
+        """Test that a matching If-None-Match returns 304 without a body"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app)
+        for path in ("/api/v1/chains", "/api/v1/tokens", "/health"):
+            first = client.get(path)
+            etag = first.headers["etag"]
+            second = client.get(path, headers={"If-None-Match": etag})
+
+            assert first.status_code == 200 and etag.startswith('"')
+            assert second.status_code == 304
+            assert second.content == b""
+            assert second.headers["etag"] == etag
+
+        assert client.get("/api/v1/chains", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_quote_revalidation_skips_summary(self, monkeypatch):
+        """Test that quotes carry Cache-Control/Age and a 304 skips the LLM"""
+        import httpx
+        from fastapi.testclient import TestClient
+        import main
+
+        summaries = []
+
+        async def fake_summary(clean_summary):
+            summaries.append(clean_summary)
+            return "Swap via Stargate"
+
+        monkeypatch.setattr(main, "summarize_quote", fake_summary)
+        monkeypatch.setattr(main.quote_service, "client", httpx.AsyncClient(
+            base_url="https://li.quest",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"estimate": {"toAmountUSD": "99"}}))
+        ))
+        params = {"fromChain": "1", "toChain": "137", "fromToken": "USDC", "toToken": "USDC", "fromAmount": "4242"}
+
+        client = TestClient(main.app)
+        first = client.get("/api/v1/quote", params=params)
+        second = client.get("/api/v1/quote", params=params, headers={"If-None-Match": first.headers["etag"]})
+
+        assert first.status_code == 200
+        assert first.json()["summary"] == "Swap via Stargate"
+        assert "max-age=" in first.headers["cache-control"]
+        assert int(first.headers["age"]) >= 0
+        assert second.status_code == 304
+        assert len(summaries) == 1
+
+    def test_detailed_view_passes_raw_bytes_through_precompressed(self, monkeypatch):
+        """Test that the detailed view embeds LI.FI's bytes and reuses its gzipped body"""
+        import json
+        import httpx
+        from fastapi.testclient import TestClient
+        import main
+
+        upstream = b'{"estimate": {"toAmountUSD": "99", "feeCosts": []}, "includedSteps": [], "extra": 1.50}'
+        summaries = []
+
+        async def fake_summary(clean_summary):
+            summaries.append(clean_summary)
+            return "Swap via Stargate"
+
+        monkeypatch.setattr(main, "summarize_quote", fake_summary)
+        monkeypatch.setattr(main.quote_service, "client", httpx.AsyncClient(
+            base_url="https://li.quest",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=upstream))
+        ))
+        params = {"fromChain": "1", "toChain": "137", "fromToken": "USDC", "toToken": "USDC", "fromAmount": "4343"}
+
+        client = TestClient(main.app)
+        first = client.get("/api/v1/quote/detailed", params=params, headers={"Accept-Encoding": "gzip"})
+        second = client.get("/api/v1/quote/detailed", params=params, headers={"Accept-Encoding": "identity"})
+
+        assert first.headers["content-encoding"] == "gzip"
+        assert first.json()["summary"] == "Swap via Stargate"
+        assert first.json()["raw_data"] == json.loads(upstream)
+        assert upstream in second.content  # passed through byte for byte
+        assert "content-encoding" not in second.headers
+        assert second.json() == first.json()
+        assert len(summaries) == 1
+
+
+class TestMetrics:
+    """Test the Prometheus metrics endpoint"""
+
+    def test_stages_are_labeled_by_endpoint_and_chain_pair(self, monkeypatch):
+        """Test that fetch, retry, parse and DB timings show up with their labels"""
+        import httpx
+        from fastapi.testclient import TestClient
+        import main
+
+        async def fake_summary(clean_summary):
+            return "Swap via Stargate"
+
+        monkeypatch.setattr(main, "summarize_quote", fake_summary)
+        monkeypatch.setattr(main.quote_service, "client", httpx.AsyncClient(
+            base_url="https://li.quest",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"estimate": {"toAmountUSD": "99"}}))
+        ))
+        params = {"fromChain": "1", "toChain": "137", "fromToken": "USDC", "toToken": "USDC", "fromAmount": "5151"}
+
+        client = TestClient(main.app)
+        assert client.get("/api/v1/quote", params=params).status_code == 200
+        assert client.get("/api/v1/analytics").status_code == 200
+        resp = client.get("/metrics")
+        text = resp.text
+
+        assert resp.headers["content-type"].startswith("text/plain")
+        # Labels are written in alphabetical order
+        labels = 'chain_pair="1-137",endpoint="/api/v1/quote",kind="quote"'
+        assert f'chaincompass_lifi_fetch_duration_seconds_count{{{labels},status="200"}}' in text
+        assert f'chaincompass_lifi_fetch_retries_bucket{{{labels},le="0.0"}}' in text
+        assert f"chaincompass_parse_duration_seconds_count{{{labels}}}" in text
+        assert 'chaincompass_db_query_duration_seconds_count{endpoint="/api/v1/analytics",operation="SELECT"}' in text
+        assert 'chaincompass_http_request_duration_seconds_count{endpoint="/api/v1/quote",method="GET",status="200"}' in text
+
+    def test_multiprocess_samples_are_aggregated(self, tmp_path):
+        """Test that /metrics output sums what every worker recorded"""
+        import os
+        import subprocess
+        import sys
+
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        root = os.path.join(os.path.dirname(__file__), "..")
+        record = "import metrics; metrics.rate_limited('quote')"
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", record], cwd=root, env=env, check=True)
+        out = subprocess.run(
+            [sys.executable, "-c", "import sys, metrics; sys.stdout.write(metrics.render().decode())"],
+            cwd=root, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+
+        assert 'chaincompass_rate_limit_rejections_total{endpoint="background",limiter="quote"} 2.0' in out
+
+    def test_empty_multiproc_dir_keeps_single_process_mode(self, tmp_path):
+        """Test that PROMETHEUS_MULTIPROC_DIR= (set but empty) is ignored"""
+        import os
+        import subprocess
+        import sys
+
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": ""}
+        root = os.path.join(os.path.dirname(__file__), "..")
+        out = subprocess.run(
+            [sys.executable, "-c", "import metrics; metrics.rate_limited('quote'); print(metrics.render().decode())"],
+            cwd=tmp_path, env={**env, "PYTHONPATH": root}, check=True, capture_output=True, text=True,
+        ).stdout
+
+        assert 'chaincompass_rate_limit_rejections_total{endpoint="background",limiter="quote"} 1.0' in out
+        assert os.listdir(tmp_path) == []
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
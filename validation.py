@@ -1,39 +1,226 @@
 """
 Rate limiting and validation middleware for ChainCompass API
 """
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import OrderedDict
+import asyncio
+import os
 import re
+import sqlite3
+import threading
+import time
+
+
+class _WindowState:
+    """Per-identifier sliding window counter state (constant size)"""
+    __slots__ = ("window", "current", "previous", "last_seen")
+
+    def __init__(self, window: int, now: float):
+        self.window = window
+        self.current = 0
+        self.previous = 0
+        self.last_seen = now
+
 
 class RateLimiter:
-    """Simple token bucket rate limiter"""
-    def __init__(self, max_requests: int = 100, window_seconds: int = 60):
+    """
+    Sliding window counter rate limiter.
+
+    Each identifier keeps two counters (this fixed window and the previous
+    one); the previous count is weighted by how much of it still overlaps
+    the sliding window. Checks are O(1) and memory per identifier is
+    constant. Identifiers idle for two windows are expired in bulk, and at
+    most `max_keys` identifiers are tracked (least recently seen dropped
+    first).
+    """
+    def __init__(self, max_requests: int = 100, window_seconds: int = 60, max_keys: int = 100_000):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.requests = defaultdict(list)
+        self.max_keys = max_keys
+        # Ordered by last access, so idle identifiers collect at the front
+        self.requests: OrderedDict[str, _WindowState] = OrderedDict()
     
     def is_allowed(self, identifier: str) -> bool:
         """Check if request is allowed for identifier (IP/address)"""
-        now = datetime.utcnow()
-        cutoff = now - timedelta(seconds=self.window_seconds)
-        
-        # Clean old requests
-        self.requests[identifier] = [
-            req_time for req_time in self.requests[identifier]
-            if req_time > cutoff
-        ]
-        
-        # Check limit
-        if len(self.requests[identifier]) >= self.max_requests:
+        now = time.monotonic()
+        self._expire(now)
+        window = int(now // self.window_seconds)
+
+        state = self.requests.get(identifier)
+        if state is None:
+            state = _WindowState(window, now)
+            self.requests[identifier] = state
+            if len(self.requests) > self.max_keys:
+                self.requests.popitem(last=False)
+        else:
+            self.requests.move_to_end(identifier)
+            state.last_seen = now
+
+        # Roll the fixed windows forward
+        if window != state.window:
+            state.previous = state.current if window == state.window + 1 else 0
+            state.current = 0
+            state.window = window
+
+        # Weight the previous window by its overlap with the sliding window
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        estimated = state.previous * (1 - elapsed) + state.current
+        if estimated >= self.max_requests:
             return False
-        
-        # Add request
-        self.requests[identifier].append(now)
+
+        state.current += 1
         return True
 
+    async def acquire(self, identifier: str) -> bool:
+        """is_allowed() for callers on the event loop"""
+        return self.is_allowed(identifier)
+
+    def _expire(self, now: float) -> None:
+        """Drop identifiers idle for two full windows (their counts are zero)"""
+        cutoff = now - 2 * self.window_seconds
+        while self.requests:
+            state = next(iter(self.requests.values()))
+            if state.last_seen > cutoff:
+                break
+            self.requests.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+class SharedRateLimiter:
+    """
+    Sliding window counter rate limiter shared by every worker process on
+    the host through a SQLite file, so "50/min" means 50/min in total rather
+    than 50/min per uvicorn worker.
+
+    To avoid a database round-trip per request, each worker leases up to
+    `lease_size` tokens at a time and spends them locally. Tokens a worker
+    leased but didn't use expire with their window, so the effective limit
+    can be up to (workers - 1) * (lease_size - 1) requests lower, never higher.
+    Uses wall-clock time, since monotonic clocks aren't comparable across processes.
+    acquire() takes new leases in a thread, so waiting for another worker's
+    write lock never stalls the event loop.
+    """
+    def __init__(
+        self,
+        max_requests: int = 100,
+        window_seconds: int = 60,
+        path: str = "./rate_limits.db",
+        name: str = "default",
+        lease_size: int = 5,
+        max_keys: int = 100_000,
+    ):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.name = name
+        self.lease_size = max(1, lease_size)
+        self.max_keys = max_keys
+        # identifier -> [window, tokens left], ordered by last access
+        self.leases: OrderedDict[str, list] = OrderedDict()
+        self.db_round_trips = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "name TEXT NOT NULL, identifier TEXT NOT NULL, window INTEGER NOT NULL, "
+            "count INTEGER NOT NULL, PRIMARY KEY (name, identifier, window))"
+        )
+
+    def is_allowed(self, identifier: str) -> bool:
+        """Check if request is allowed for identifier (IP/address)"""
+        now = time.time()
+        window = int(now // self.window_seconds)
+
+        if self._spend(identifier, window):
+            return True
+        return self._grant(identifier, window, self._lease(identifier, window, now))
+
+    async def acquire(self, identifier: str) -> bool:
+        """is_allowed() for callers on the event loop"""
+        now = time.time()
+        window = int(now // self.window_seconds)
+
+        if self._spend(identifier, window):
+            return True
+        granted = await asyncio.to_thread(self._lease, identifier, window, now)
+        return self._grant(identifier, window, granted)
+
+    def _spend(self, identifier: str, window: int) -> bool:
+        """Use a token from this worker's lease, if it has one left"""
+        lease = self.leases.get(identifier)
+        if lease is not None and lease[0] == window and lease[1] > 0:
+            lease[1] -= 1
+            self.leases.move_to_end(identifier)
+            return True
+        return False
+
+    def _grant(self, identifier: str, window: int, granted: int) -> bool:
+        """Keep a fresh lease, spending its first token on this request"""
+        if granted <= 0:
+            return False
+        self.leases[identifier] = [window, granted - 1]
+        self.leases.move_to_end(identifier)
+        if len(self.leases) > self.max_keys:
+            self.leases.popitem(last=False)
+        return True
+
+    def _lease(self, identifier: str, window: int, now: float) -> int:
+        """Atomically reserve up to lease_size tokens from the shared counters"""
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        with self._lock:
+            self.db_round_trips += 1
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = dict(self._conn.execute(
+                    "SELECT window, count FROM rate_limits "
+                    "WHERE name = ? AND identifier = ? AND window IN (?, ?)",
+                    (self.name, identifier, window, window - 1),
+                ).fetchall())
+                estimated = rows.get(window - 1, 0) * (1 - elapsed) + rows.get(window, 0)
+                granted = min(self.lease_size, int(self.max_requests - estimated))
+                if granted > 0:
+                    self._conn.execute(
+                        "INSERT INTO rate_limits (name, identifier, window, count) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (name, identifier, window) DO UPDATE SET count = count + excluded.count",
+                        (self.name, identifier, window, granted),
+                    )
+                # Old windows no longer affect any estimate
+                if self.db_round_trips % 100 == 0:
+                    self._conn.execute(
+                        "DELETE FROM rate_limits WHERE name = ? AND window < ?", (self.name, window - 1)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return granted
+
+    def __len__(self) -> int:
+        return len(self.leases)
+
+
+def create_rate_limiter(name: str, max_requests: int, window_seconds: int):
+    """
+    Build a rate limiter for the configured RATE_LIMIT_BACKEND: "memory"
+    (per worker, the default) or "sqlite" (shared by all workers on the host).
+    """
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    if backend == "memory":
+        return RateLimiter(max_requests=max_requests, window_seconds=window_seconds)
+    if backend == "sqlite":
+        return SharedRateLimiter(
+            max_requests=max_requests,
+            window_seconds=window_seconds,
+            path=os.getenv("RATE_LIMIT_PATH", "./rate_limits.db"),
+            name=name,
+            lease_size=int(os.getenv("RATE_LIMIT_LEASE_SIZE", "5")),
+        )
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
 # Global rate limiters
-quote_limiter = RateLimiter(max_requests=50, window_seconds=60)  # 50/min per address
-tx_limiter = RateLimiter(max_requests=10, window_seconds=60)  # 10/min per address
+quote_limiter = create_rate_limiter("quote", max_requests=50, window_seconds=60)  # 50/min per address
+tx_limiter = create_rate_limiter("tx", max_requests=10, window_seconds=60)  # 10/min per address
 
 def validate_ethereum_address(address: str) -> bool:
     """Validate Ethereum address format"""